@@ -0,0 +1,66 @@
+import base64
+import hashlib
+import hmac
+import re
+from typing import Optional
+
+# Общий модуль для qr_service (выдаёт коды), бота (проверяет до запроса) и
+# users_service: формат и алгоритм у всех один. В образы копируется при сборке
+# из контекста common (см. Dockerfile сервисов), локально — через PYTHONPATH
+
+SEPARATOR = "."
+# 5 байт HMAC = 40 бит = ровно 8 символов base32 без '='
+TAG_BYTES = 5
+_TAG_RE = re.compile(r"[A-Z2-7]{8}")
+
+
+class CodeSigner:
+    """Подписанные коды вида <код>.<8 символов base32 от HMAC-SHA256 кода>.
+
+    Опечатку или выдуманный код отсеивает сравнение подписи, без запроса
+    к базе. Без ключа подпись выключена и коды принимаются как есть.
+    """
+
+    def __init__(self, key: str, accept_plain: bool):
+        self.key = key.encode("utf-8")
+        self.enabled = bool(key)
+        self.accept_plain = accept_plain or not self.enabled
+        self.rejected = 0
+
+    def tag(self, code: str) -> str:
+        digest = hmac.new(self.key, code.encode("utf-8"), hashlib.sha256).digest()
+        return base64.b32encode(digest[:TAG_BYTES]).decode("ascii")
+
+    def sign(self, code: str) -> str:
+        if not self.enabled:
+            return code
+        return f"{code}{SEPARATOR}{self.tag(code)}"
+
+    def verify(self, raw: str) -> Optional[str]:
+        """Код гостя из отсканированной или введённой строки.
+
+        None — строку можно отклонить сразу: подпись не сошлась или код без
+        подписи, а такие не принимаются. Строка с хвостом из точки и восьми
+        символов base32 всегда считается подписанной.
+        """
+        raw = raw.strip()
+        if not self.enabled:
+            return raw
+
+        code, sep, tag = raw.rpartition(SEPARATOR)
+        tag = tag.upper()  # при ручном вводе регистр мог потеряться
+        if sep and code and _TAG_RE.fullmatch(tag):
+            if hmac.compare_digest(tag, self.tag(code)):
+                return code
+        elif self.accept_plain:
+            return raw
+
+        self.rejected += 1
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "accept_plain": self.accept_plain,
+            "rejected": self.rejected,
+        }
@@ -1,8 +1,16 @@
 import os
+import asyncio
 import logging
+import sys
+import tempfile
+import time
 import httpx
 from io import BytesIO
 from datetime import datetime
+from typing import Optional
+
+from code_signing import CodeSigner
+from roster_replica import ALREADY_MARKED, NOT_FOUND, RosterReplica
 
 from telegram import (
     Update,
@@ -12,10 +20,13 @@ from telegram import (
 )
 from telegram.ext import (
     Application,
+    BaseUpdateProcessor,
+    CallbackContext,
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
     ContextTypes,
+    ExtBot,
     filters,
 )
 
@@ -23,9 +34,71 @@ logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
     level=logging.INFO,
 )
+logger = logging.getLogger(__name__)
 
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
+# Адрес Bot API, меняется только для локальных нагрузочных тестов
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org/bot")
 USERS_SERVICE_URL = os.getenv("USERS_SERVICE_URL", "http://users_service:8000")
+QR_SERVICE_URL = os.getenv("QR_SERVICE_URL", "http://qr_service:8001")
+IMPORT_POLL_INTERVAL = float(os.getenv("IMPORT_POLL_INTERVAL", "2"))
+# Сколько секунд задача импорта может не продвигаться, прежде чем бот
+# перестанет следить за ней
+IMPORT_STALL_TIMEOUT = float(os.getenv("IMPORT_STALL_TIMEOUT", "600"))
+# Подпись кодов — те же ключ и флаг, что у users_service
+CODE_SIGNING_KEY = os.getenv("CODE_SIGNING_KEY", "")
+ACCEPT_PLAIN_CODES = os.getenv("ACCEPT_PLAIN_CODES", "1") == "1"
+
+# polling — как раньше; webhook — Telegram сам присылает апдейты на WEBHOOK_URL
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # публичный адрес, например https://bot.example.com/telegram
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+# Сколько апдейтов обрабатывать одновременно (1 — строго по очереди)
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "64"))
+GUESTS_PAGE_SIZE = 50
+# Копия списка гостей в памяти бота по журналу /changes (0 — каждый скан идёт в /mark)
+ROSTER_REPLICA = os.getenv("ROSTER_REPLICA", "1") == "1"
+REPLICA_SYNC_INTERVAL = float(os.getenv("REPLICA_SYNC_INTERVAL", "2"))
+REPLICA_PAGE_SIZE = 5000
+# Общий клиент users_service: пул соединений с keep-alive на всё время работы бота
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "2"))
+
+# Таймауты по эндпоинтам: проверка доступа и отметка должны отвечать быстро,
+# выгрузки и загрузка файлов — могут долго
+TIMEOUT_ACL = httpx.Timeout(3.0, connect=HTTP_CONNECT_TIMEOUT)
+TIMEOUT_MARK = httpx.Timeout(5.0, connect=HTTP_CONNECT_TIMEOUT)
+TIMEOUT_SEARCH = httpx.Timeout(5.0, connect=HTTP_CONNECT_TIMEOUT)
+TIMEOUT_DEFAULT = httpx.Timeout(5.0, connect=HTTP_CONNECT_TIMEOUT)
+TIMEOUT_LIST = httpx.Timeout(10.0, connect=HTTP_CONNECT_TIMEOUT)
+TIMEOUT_EXPORT = httpx.Timeout(30.0, connect=HTTP_CONNECT_TIMEOUT)
+TIMEOUT_UPLOAD = httpx.Timeout(60.0, connect=HTTP_CONNECT_TIMEOUT)
+TIMEOUT_DECODE = httpx.Timeout(15.0, connect=HTTP_CONNECT_TIMEOUT)
+# Холодная генерация большого списка рисует каждый код, read — пауза между кусками
+TIMEOUT_GENERATE = httpx.Timeout(300.0, connect=HTTP_CONNECT_TIMEOUT)
+
+# Лимит Bot API на отправку файлов
+TELEGRAM_UPLOAD_LIMIT = 50 * 1024 * 1024
+
+# Отклоняет опечатки и чужие QR до запроса к users_service
+code_signer = CodeSigner(CODE_SIGNING_KEY, ACCEPT_PLAIN_CODES)
+
+INVALID_CODE_TEXT = "❌ Код не найден: подпись не совпадает."
+
+roster_replica = RosterReplica(REPLICA_SYNC_INTERVAL, REPLICA_PAGE_SIZE, TIMEOUT_LIST)
+
+# Создаются в post_init, закрываются в post_shutdown
+users_api: Optional[httpx.AsyncClient] = None
+qr_api: Optional[httpx.AsyncClient] = None
+
+# Сколько секунд помнить ответ users_service о доступе пользователя
+ACL_ALLOW_TTL = float(os.getenv("ACL_ALLOW_TTL", "300"))
+ACL_DENY_TTL = float(os.getenv("ACL_DENY_TTL", "30"))
 
 ADMIN_IDS = [5502429477]
 
@@ -34,22 +107,102 @@ def is_admin(user_id: int) -> bool:
     return user_id in ADMIN_IDS
 
 
-async def is_allowed(user_id: int) -> bool:
+class AccessCache:
+    """Кэш ответов users_service о доступе пользователей.
+
+    Разрешение помнится ACL_ALLOW_TTL секунд, отказ — ACL_DENY_TTL, чтобы
+    только что добавленный пользователь не ждал долго. Параллельные проверки
+    одного пользователя делят один запрос. После /add_tg_user кэш сбрасывается.
+    """
+
+    def __init__(self, allow_ttl: float, deny_ttl: float, maxsize: int = 10000):
+        self.allow_ttl = allow_ttl
+        self.deny_ttl = deny_ttl
+        self.maxsize = maxsize
+        self._entries = {}  # (user_id, username) -> (allowed, expires_at)
+        self._inflight = {}  # (user_id, username) -> asyncio.Task
+        self._generation = 0
+
+    async def get(self, user_id: int, username, fetch) -> bool:
+        key = (user_id, username)
+        entry = self._entries.get(key)
+        if entry and entry[1] > time.monotonic():
+            return entry[0]
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key, fetch))
+            self._inflight[key] = task
+        # shield: отмена одного ожидающего не должна отменять запрос для остальных
+        return await asyncio.shield(task)
+
+    async def _load(self, key, fetch) -> bool:
+        generation = self._generation
+        try:
+            allowed = await fetch()
+        finally:
+            if self._inflight.get(key) is asyncio.current_task():
+                del self._inflight[key]
+
+        # Права поменялись, пока шёл запрос, — такой ответ не запоминаем
+        if generation == self._generation:
+            if len(self._entries) >= self.maxsize:
+                now = time.monotonic()
+                self._entries = {k: v for k, v in self._entries.items() if v[1] > now}
+            ttl = self.allow_ttl if allowed else self.deny_ttl
+            self._entries[key] = (allowed, time.monotonic() + ttl)
+        return allowed
+
+    def invalidate(self):
+        self._generation += 1
+        self._entries.clear()
+        self._inflight.clear()
+
+
+access_cache = AccessCache(ACL_ALLOW_TTL, ACL_DENY_TTL)
+
+
+async def fetch_access(user_id: int, username) -> bool:
+    resp = await users_api.get(f"/tg_users/{user_id}", timeout=TIMEOUT_ACL)
+    resp.raise_for_status()
+    if resp.json()["allowed"]:
+        return True
+    # /add_tg_user добавляет пользователей по нику, без telegram_id
+    if username:
+        resp = await users_api.get(f"/tg_users/by_username/{username}", timeout=TIMEOUT_ACL)
+        resp.raise_for_status()
+        return resp.json()["allowed"]
+    return False
+
+
+async def is_allowed(user_id: int, username=None) -> bool:
     if is_admin(user_id):
         return True
 
-    async with httpx.AsyncClient() as client:
-        try:
-            resp = await client.get(f"{USERS_SERVICE_URL}/tg_users", timeout=5.0)
-            resp.raise_for_status()
-            users = resp.json()
-        except Exception:
-            return False
+    try:
+        return await access_cache.get(user_id, username, lambda: fetch_access(user_id, username))
+    except Exception:
+        # Ошибки не кэшируются: следующий апдейт спросит сервис заново
+        return False
 
-    return any(
-        u.get("telegram_id") == user_id and u.get("allowed", True)
-        for u in users
-    )
+
+class BotContext(CallbackContext[ExtBot, dict, dict, dict]):
+    """Контекст апдейта. PTB создаёт его один раз на апдейт и передаёт во все
+    группы обработчиков, поэтому решение о доступе хранится здесь."""
+
+    def __init__(self, application, chat_id=None, user_id=None):
+        super().__init__(application, chat_id=chat_id, user_id=user_id)
+        self.access = None
+
+
+async def check_access(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
+    """Разрешён ли автор апдейта; users_service спрашивается не больше раза на апдейт."""
+    access = getattr(context, "access", None)
+    if access is None:
+        user = update.effective_user
+        access = bool(user) and await is_allowed(user.id, user.username)
+        context.access = access
+    return access
 
 
 def admin_only(handler):
@@ -72,9 +225,8 @@ def allowed_only(handler):
         user = update.effective_user
         if not user:
             return
-        user_id = user.id
 
-        if not await is_allowed(user_id):
+        if not await check_access(update, context):
             if update.message:
                 await update.message.reply_text("❌ У вас нет доступа. Обратитесь к администратору.")
             return
@@ -88,15 +240,9 @@ async def reject_unauthorized(update: Update, context: ContextTypes.DEFAULT_TYPE
     if not user:
         return
 
-    user_id = user.id
-
-    if is_admin(user_id):
-        return
-
-    if await is_allowed(user_id):
-        return
-
-    return
+    # Решение о доступе запоминается в context и переиспользуется
+    # обработчиками группы 1 того же апдейта
+    await check_access(update, context)
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -105,16 +251,15 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     user_id = user.id
 
-    if not await is_allowed(user_id):
+    if not await check_access(update, context):
         return
 
-    async with httpx.AsyncClient() as client:
-        try:
-            resp = await client.get(f"{USERS_SERVICE_URL}/stats", timeout=5.0)
-            resp.raise_for_status()
-            stats = resp.json()
-        except Exception:
-            stats = None
+    try:
+        resp = await users_api.get("/stats", timeout=TIMEOUT_DEFAULT)
+        resp.raise_for_status()
+        stats = resp.json()
+    except Exception:
+        stats = None
 
     if stats:
         status = (
@@ -158,6 +303,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "/add_guest CODE ФИО - добавить гостя\n"
             "/add_tg_user @username ИМЯ - добавить пользователя по нику\n"
             "/export - выгрузить отчёты\n"
+            "/qr_codes [badge] - архив QR-кодов всех гостей (badge — с именами)\n"
             "/clear_all - очистить базу\n"
         )
 
@@ -173,20 +319,19 @@ async def add_guest_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     code = context.args[0]
     name = " ".join(context.args[1:])
 
-    async with httpx.AsyncClient() as client:
-        try:
-            resp = await client.post(
-                f"{USERS_SERVICE_URL}/guests",
-                json={"code": code, "name": name},
-                timeout=5.0,
-            )
-            if resp.status_code == 400:
-                await update.message.reply_text("❌ Гость с таким кодом уже существует.")
-                return
-            resp.raise_for_status()
-        except Exception as e:
-            await update.message.reply_text(f"❌ Ошибка при добавлении гостя: {e}")
+    try:
+        resp = await users_api.post(
+            "/guests",
+            json={"code": code, "name": name},
+            timeout=TIMEOUT_DEFAULT,
+        )
+        if resp.status_code == 400:
+            await update.message.reply_text("❌ Гость с таким кодом уже существует.")
             return
+        resp.raise_for_status()
+    except Exception as e:
+        await update.message.reply_text(f"❌ Ошибка при добавлении гостя: {e}")
+        return
 
     await update.message.reply_text(f"✅ Гость добавлен:\nКод: {code}\nИмя: {name}")
 
@@ -205,27 +350,27 @@ async def add_tg_user_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     name = " ".join(context.args[1:])
 
-    async with httpx.AsyncClient() as client:
-        try:
-            resp = await client.post(
-                f"{USERS_SERVICE_URL}/tg_users",
-                json={
-                    "telegram_id": None,
-                    "username": username,
-                    "name": name,
-                    "allowed": True,
-                },
-                timeout=5.0,
+    try:
+        resp = await users_api.post(
+            "/tg_users",
+            json={
+                "telegram_id": None,
+                "username": username,
+                "name": name,
+                "allowed": True,
+            },
+            timeout=TIMEOUT_DEFAULT,
+        )
+        if resp.status_code not in (200, 201):
+            await update.message.reply_text(
+                f"❌ Ошибка при добавлении пользователя. Код: {resp.status_code}"
             )
-            if resp.status_code not in (200, 201):
-                await update.message.reply_text(
-                    f"❌ Ошибка при добавлении пользователя. Код: {resp.status_code}"
-                )
-                return
-        except Exception as e:
-            await update.message.reply_text(f"❌ Ошибка подключения: {e}")
             return
+    except Exception as e:
+        await update.message.reply_text(f"❌ Ошибка подключения: {e}")
+        return
 
+    access_cache.invalidate()
     await update.message.reply_text(
         f"✅ Пользователь добавлен.\nUsername: @{username}\nИмя: {name}"
     )
@@ -238,24 +383,36 @@ async def mark(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     code = context.args[0]
+    guest_code = code_signer.verify(code)
+    if guest_code is None:
+        await update.message.reply_text(INVALID_CODE_TEXT)
+        return
 
-    async with httpx.AsyncClient() as client:
-        try:
-            resp = await client.post(
-                f"{USERS_SERVICE_URL}/mark",
-                json={"code": code, "method": "manual"},
-                timeout=5.0,
-            )
-            if resp.status_code == 404:
-                await update.message.reply_text("❌ Код не найден в системе.")
-                return
-            resp.raise_for_status()
-            body = resp.json()
-            data = body["data"]
-            already = body.get("already_marked", False)
-        except Exception as e:
-            await update.message.reply_text(f"❌ Ошибка при отметке: {e}")
+    state = await roster_replica.state(guest_code)
+    if state == NOT_FOUND:
+        await update.message.reply_text("❌ Код не найден в системе.")
+        return
+    if state == ALREADY_MARKED:
+        await update.message.reply_text("⚠️ Гость уже пришёл, повторная отметка не требуется.")
+        return
+
+    try:
+        resp = await users_api.post(
+            "/mark",
+            json={"code": code, "method": "manual"},
+            timeout=TIMEOUT_MARK,
+        )
+        if resp.status_code == 404:
+            await update.message.reply_text("❌ Код не найден в системе.")
             return
+        resp.raise_for_status()
+        body = resp.json()
+        data = body["data"]
+        already = body.get("already_marked", False)
+    except Exception as e:
+        await update.message.reply_text(f"❌ Ошибка при отметке: {e}")
+        return
+    roster_replica.record_mark(data)
 
     if already:
         await update.message.reply_text("⚠️ Гость уже пришёл, повторная отметка не требуется.")
@@ -279,18 +436,17 @@ async def find(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     query_text = " ".join(context.args)
 
-    async with httpx.AsyncClient() as client:
-        try:
-            resp = await client.get(
-                f"{USERS_SERVICE_URL}/search",
-                params={"query": query_text},
-                timeout=5.0,
-            )
-            resp.raise_for_status()
-            results = resp.json()
-        except Exception as e:
-            await update.message.reply_text(f"❌ Ошибка поиска: {e}")
-            return
+    try:
+        resp = await users_api.get(
+            "/search",
+            params={"query": query_text},
+            timeout=TIMEOUT_SEARCH,
+        )
+        resp.raise_for_status()
+        results = resp.json()
+    except Exception as e:
+        await update.message.reply_text(f"❌ Ошибка поиска: {e}")
+        return
 
     if not results:
         await update.message.reply_text("❌ Никого не нашли.")
@@ -302,20 +458,20 @@ async def find(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("⚠️ Гость уже пришёл.")
             return
 
-        async with httpx.AsyncClient() as client:
-            try:
-                mark_resp = await client.post(
-                    f"{USERS_SERVICE_URL}/mark",
-                    json={"code": r["code"], "method": "search"},
-                    timeout=5.0,
-                )
-                mark_resp.raise_for_status()
-                body = mark_resp.json()
-                data = body["data"]
-                already = body.get("already_marked", False)
-            except Exception as e:
-                await update.message.reply_text(f"❌ Ошибка отметки: {e}")
-                return
+        try:
+            mark_resp = await users_api.post(
+                "/mark",
+                json={"code": r["signed_code"], "method": "search"},
+                timeout=TIMEOUT_MARK,
+            )
+            mark_resp.raise_for_status()
+            body = mark_resp.json()
+            data = body["data"]
+            already = body.get("already_marked", False)
+        except Exception as e:
+            await update.message.reply_text(f"❌ Ошибка отметки: {e}")
+            return
+        roster_replica.record_mark(data)
 
         if already:
             await update.message.reply_text("⚠️ Гость уже пришёл.")
@@ -335,7 +491,7 @@ async def find(update: Update, context: ContextTypes.DEFAULT_TYPE):
         status = "✅" if r["scanned"] else "⏳"
         text_btn = f"{status} {r['name']} ({r['code']})"
         keyboard.append(
-            [InlineKeyboardButton(text_btn, callback_data=f"mark_{r['code']}")]
+            [InlineKeyboardButton(text_btn, callback_data=f"mark_{r['signed_code']}")]
         )
 
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -366,18 +522,24 @@ async def button(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await query.edit_message_text("❌ Только администратор может очищать базу.")
             return
 
-        async with httpx.AsyncClient() as client:
+        try:
+            resp = await users_api.delete("/clear_all", timeout=TIMEOUT_LIST)
+            if resp.status_code != 200:
+                await query.edit_message_text(
+                    f"❌ Ошибка очистки: {resp.status_code}"
+                )
+                return
+            data_resp = resp.json()
+        except Exception as e:
+            await query.edit_message_text(f"❌ Ошибка подключения: {e}")
+            return
+
+        # Не ждём фоновой синхронизации: иначе ещё пару секунд гости считались бы пришедшими
+        if ROSTER_REPLICA:
             try:
-                resp = await client.delete(f"{USERS_SERVICE_URL}/clear_all", timeout=10.0)
-                if resp.status_code != 200:
-                    await query.edit_message_text(
-                        f"❌ Ошибка очистки: {resp.status_code}"
-                    )
-                    return
-                data_resp = resp.json()
+                await roster_replica.refresh()
             except Exception as e:
-                await query.edit_message_text(f"❌ Ошибка подключения: {e}")
-                return
+                logger.warning(f"Roster replica refresh after clear failed: {e}")
 
         await query.edit_message_text(
             f"✅ База очищена.\n"
@@ -385,13 +547,12 @@ async def button(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"Удалено отметок: {data_resp.get('deleted_marks', 0)}"
         )
 
-        async with httpx.AsyncClient() as client:
-            try:
-                export_resp = await client.get(f"{USERS_SERVICE_URL}/export", timeout=30.0)
-                export_resp.raise_for_status()
-                export_data = export_resp.json()
-            except Exception:
-                return
+        try:
+            export_resp = await users_api.get("/export", timeout=TIMEOUT_EXPORT)
+            export_resp.raise_for_status()
+            export_data = export_resp.json()
+        except Exception:
+            return
 
         timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
 
@@ -423,30 +584,48 @@ async def button(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text("Отмена очистки базы.")
         return
 
+    if data.startswith("guests_"):
+        if not await check_access(update, context):
+            await query.edit_message_text("❌ У вас нет доступа.")
+            return
+
+        try:
+            guests, text, reply_markup = await render_guests_page(context, int(data[7:]))
+        except Exception as e:
+            await query.edit_message_text(f"❌ Ошибка получения списка гостей: {e}")
+            return
+
+        if not guests:
+            await query.edit_message_text("Список гостей пуст.")
+            return
+
+        await query.edit_message_text(text, reply_markup=reply_markup)
+        return
+
     if data.startswith("mark_"):
-        if not await is_allowed(query.from_user.id):
+        if not await check_access(update, context):
             await query.edit_message_text("❌ У вас нет доступа.")
             return
 
         code = data[5:]
 
-        async with httpx.AsyncClient() as client:
-            try:
-                resp = await client.post(
-                    f"{USERS_SERVICE_URL}/mark",
-                    json={"code": code, "method": "search"},
-                    timeout=5.0,
-                )
-                if resp.status_code == 404:
-                    await query.edit_message_text("❌ Код не найден.")
-                    return
-                resp.raise_for_status()
-                body = resp.json()
-                data_resp = body["data"]
-                already = body.get("already_marked", False)
-            except Exception as e:
-                await query.edit_message_text(f"❌ Ошибка отметки: {e}")
+        try:
+            resp = await users_api.post(
+                "/mark",
+                json={"code": code, "method": "search"},
+                timeout=TIMEOUT_MARK,
+            )
+            if resp.status_code == 404:
+                await query.edit_message_text("❌ Код не найден.")
                 return
+            resp.raise_for_status()
+            body = resp.json()
+            data_resp = body["data"]
+            already = body.get("already_marked", False)
+        except Exception as e:
+            await query.edit_message_text(f"❌ Ошибка отметки: {e}")
+            return
+        roster_replica.record_mark(data_resp)
 
         if already:
             await query.edit_message_text("⚠️ Гость уже пришёл.")
@@ -475,54 +654,193 @@ async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     await update.message.reply_text(f"Размер файла: {len(file_bytes)} байт")
 
-    if not (filename.endswith(".xlsx") or filename.endswith(".xls")):
-        await update.message.reply_text("❌ Это не Excel-файл (.xlsx/.xls).")
+    if not filename.endswith((".xlsx", ".xls", ".csv")):
+        await update.message.reply_text("❌ Это не Excel или CSV-файл (.xlsx/.xls/.csv).")
         return
 
     file_obj = BytesIO(file_bytes)
 
-    async with httpx.AsyncClient() as client:
-        try:
-            resp = await client.post(
-                f"{USERS_SERVICE_URL}/import_excel",
-                files={
-                    "file": (
-                        document.file_name,
-                        file_obj,
-                        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    )
-                },
-                timeout=60.0,
-            )
-            if resp.status_code != 200:
-                await update.message.reply_text(
-                    "❌ Ошибка импорта Excel.\n"
-                    f"Код: {resp.status_code}\n"
-                    f"Текст: {resp.text[:300]}"
+    try:
+        resp = await users_api.post(
+            "/import_excel",
+            params={"background": "true"},
+            files={
+                "file": (
+                    document.file_name,
+                    file_obj,
+                    document.mime_type or "application/octet-stream",
                 )
-                return
-
-            res = resp.json()
-        except Exception as e:
-            await update.message.reply_text(f"❌ Ошибка сервера при импорте: {e}")
+            },
+            timeout=TIMEOUT_UPLOAD,
+        )
+        if resp.status_code != 200:
+            await update.message.reply_text(
+                "❌ Ошибка импорта Excel.\n"
+                f"Код: {resp.status_code}\n"
+                f"Текст: {resp.text[:300]}"
+            )
             return
 
-    await update.message.reply_text(
-        f"✅ Импорт завершён.\nДобавлено гостей: {res.get('added_guests', 0)}"
-    )
+        job_id = resp.json()["job_id"]
+    except Exception as e:
+        await update.message.reply_text(f"❌ Ошибка сервера при импорте: {e}")
+        return
 
+    progress = await update.message.reply_text("⏳ Импорт запущен...")
+    # Опрос идёт отдельной задачей, чтобы не держать обработку других апдейтов
+    context.application.create_task(track_import_job(job_id, progress))
+
+
+@allowed_only
+async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Фото с QR-кодом: распознать в qr_service и сразу отметить гостя."""
+    message = update.message
+    if message.photo:
+        # Последний размер — самый крупный
+        file = await message.photo[-1].get_file()
+    else:
+        file = await message.document.get_file()
+    image = await file.download_as_bytearray()
+
+    try:
+        resp = await qr_api.post(
+            "/decode",
+            files={"file": ("photo.jpg", bytes(image), "image/jpeg")},
+            timeout=TIMEOUT_DECODE,
+        )
+        resp.raise_for_status()
+        codes = resp.json()["codes"]
+    except Exception as e:
+        await message.reply_text(f"❌ Ошибка распознавания QR: {e}")
+        return
+
+    if not codes:
+        await message.reply_text(
+            "❌ QR-код на фото не найден. Снимите код ближе и ровнее или отправьте его текстом."
+        )
+        return
+
+    for code in codes:
+        guest_code = code_signer.verify(code)
+        if guest_code is None:
+            await message.reply_text(f"❌ QR-код «{code}» не из списка гостей: подпись не совпадает.")
+            continue
+
+        state = await roster_replica.state(guest_code)
+        if state == NOT_FOUND:
+            await message.reply_text(f"❌ Код {code} не найден в системе.")
+            continue
+        if state == ALREADY_MARKED:
+            first = roster_replica.marks[guest_code]
+            await message.reply_text(f"⚠️ Гость уже пришёл: {first['name']} ({guest_code}), {first['timestamp']}")
+            continue
 
-@admin_only
-async def send_reports(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    async with httpx.AsyncClient() as client:
         try:
-            resp = await client.get(f"{USERS_SERVICE_URL}/export", timeout=30.0)
+            resp = await users_api.post(
+                "/mark",
+                json={"code": code, "method": "qr"},
+                timeout=TIMEOUT_MARK,
+            )
+            if resp.status_code == 404:
+                await message.reply_text(f"❌ Код {code} не найден в системе.")
+                continue
             resp.raise_for_status()
-            data = resp.json()
+            body = resp.json()
+            data = body["data"]
+            already = body.get("already_marked", False)
         except Exception as e:
-            await update.message.reply_text(f"❌ Ошибка получения отчёта: {e}")
+            await message.reply_text(f"❌ Ошибка отметки: {e}")
+            continue
+        roster_replica.record_mark(data)
+
+        if already:
+            await message.reply_text(f"⚠️ Гость уже пришёл: {data['name']} ({data['code']})")
+            continue
+
+        await message.reply_text(
+            "✅ Отметка сохранена\n"
+            f"Код: {data['code']}\n"
+            f"Имя: {data['name']}\n"
+            f"Время: {data['timestamp']}\n"
+            f"Метод: {data['method']}\n"
+        )
+
+
+async def track_import_job(job_id: str, progress):
+    loop = asyncio.get_running_loop()
+    job = None
+    last_text = None
+    failures = 0
+    last_progress = None
+    progress_at = loop.time()
+
+    while True:
+        await asyncio.sleep(IMPORT_POLL_INTERVAL)
+        try:
+            resp = await users_api.get(f"/import_jobs/{job_id}", timeout=TIMEOUT_DEFAULT)
+            resp.raise_for_status()
+            job = resp.json()
+            failures = 0
+        except Exception:
+            failures += 1
+            if failures >= 5:
+                job = None
+                break
+            continue
+
+        if job["status"] in ("done", "failed"):
+            break
+
+        current = (job["status"], job["rows_processed"])
+        if current != last_progress:
+            last_progress = current
+            progress_at = loop.time()
+        elif loop.time() - progress_at > IMPORT_STALL_TIMEOUT:
+            logger.warning(f"Import job {job_id} made no progress for {IMPORT_STALL_TIMEOUT:.0f}s, stop tracking")
+            await progress.edit_text(
+                f"⚠️ Импорт не продвигается {IMPORT_STALL_TIMEOUT / 60:.0f} мин, "
+                "бот перестал следить за ним.\n"
+                f"Обработано строк: {job['rows_processed']} из {job['total_rows'] or '?'}"
+            )
             return
 
+        text = (
+            "⏳ Импорт...\n"
+            f"Обработано строк: {job['rows_processed']} из {job['total_rows'] or '?'}\n"
+            f"Добавлено гостей: {job['added_guests']}\n"
+            f"Ошибок: {job['errors_count']}"
+        )
+        if text != last_text:
+            try:
+                await progress.edit_text(text)
+            except Exception:
+                pass
+            last_text = text
+
+    if job is None:
+        await progress.edit_text("❌ Не удалось получить статус импорта.")
+        return
+
+    if job["status"] == "failed":
+        await progress.edit_text(f"❌ Ошибка импорта: {job.get('error')}")
+        return
+
+    text = f"✅ Импорт завершён.\nДобавлено гостей: {job.get('added_guests', 0)}"
+    if job.get("errors_count"):
+        text += f"\nОшибок в строках: {job['errors_count']}"
+    await progress.edit_text(text)
+
+
+@admin_only
+async def send_reports(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        resp = await users_api.get("/export", timeout=TIMEOUT_EXPORT)
+        resp.raise_for_status()
+        data = resp.json()
+    except Exception as e:
+        await update.message.reply_text(f"❌ Ошибка получения отчёта: {e}")
+        return
+
     timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
 
     csv_content = "\ufeff" + data["csv"]
@@ -545,30 +863,116 @@ async def send_reports(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
-@allowed_only
-async def show_guests(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    async with httpx.AsyncClient() as client:
+@admin_only
+async def send_qr_codes(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    style = context.args[0] if context.args else "plain"
+    if style not in ("plain", "badge"):
+        await update.message.reply_text("Использование: /qr_codes [badge]")
+        return
+
+    await update.message.reply_text("⏳ Готовлю архив QR-кодов...")
+
+    # Архив пишется на диск по мере скачивания, а не собирается в памяти
+    with tempfile.TemporaryFile() as archive:
         try:
-            resp = await client.get(f"{USERS_SERVICE_URL}/guests", timeout=10.0)
-            resp.raise_for_status()
-            guests = resp.json()
+            async with qr_api.stream(
+                "GET",
+                "/generate",
+                params={"style": style},
+                timeout=TIMEOUT_GENERATE,
+            ) as resp:
+                if resp.status_code == 404:
+                    await update.message.reply_text("📭 Список гостей пуст.")
+                    return
+                resp.raise_for_status()
+                async for chunk in resp.aiter_bytes():
+                    archive.write(chunk)
         except Exception as e:
-            await update.message.reply_text(f"❌ Ошибка получения списка гостей: {e}")
+            await update.message.reply_text(f"❌ Ошибка генерации QR-кодов: {e}")
             return
 
-    if not guests:
-        await update.message.reply_text("Список гостей пуст.")
-        return
+        size = archive.tell()
+        if size > TELEGRAM_UPLOAD_LIMIT:
+            await update.message.reply_text(
+                f"❌ Архив {size // (1024 * 1024)} МБ больше лимита Telegram в 50 МБ. "
+                "Скачайте его напрямую из qr_service: GET /generate"
+            )
+            return
+
+        archive.seek(0)
+        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        await update.message.reply_document(
+            document=archive,
+            filename=f"qr_{style}_{timestamp}.zip",
+            caption="🏷 QR-коды гостей" if style == "plain" else "🏷 Бейджи гостей",
+            read_timeout=TIMEOUT_UPLOAD.read,
+            write_timeout=TIMEOUT_UPLOAD.read,
+        )
+
+
+async def fetch_guests_page(cursor):
+    """Страница гостей после cursor = (name, code) и признак, что есть следующая."""
+    params = {"limit": GUESTS_PAGE_SIZE + 1, "signed": "true"}
+    if cursor:
+        params["after_name"], params["after_code"] = cursor
+
+    resp = await users_api.get("/guests", params=params, timeout=TIMEOUT_LIST)
+    resp.raise_for_status()
+    guests = resp.json()
+
+    return guests[:GUESTS_PAGE_SIZE], len(guests) > GUESTS_PAGE_SIZE
+
+
+async def render_guests_page(context: ContextTypes.DEFAULT_TYPE, page: int):
+    """Текст и клавиатура страницы page.
+
+    callback_data ограничена 64 байтами, поэтому в кнопках только номер
+    страницы, а начало каждой страницы (name, code) лежит в user_data.
+    """
+    cursors = context.user_data.get("guest_cursors") or [None]
+    if page >= len(cursors):
+        page = 0
+    guests, has_more = await fetch_guests_page(cursors[page])
+
+    # Начало следующей страницы — последний гость текущей
+    del cursors[page + 1:]
+    if has_more:
+        cursors.append((guests[-1]["name"], guests[-1]["code"]))
+    context.user_data["guest_cursors"] = cursors
 
     keyboard = []
-    for g in guests[:50]:
+    for g in guests:
         text_btn = f"{g['name']} ({g['code']})"
         keyboard.append(
-            [InlineKeyboardButton(text_btn, callback_data=f"mark_{g['code']}")]
+            [InlineKeyboardButton(text_btn, callback_data=f"mark_{g['signed_code']}")]
         )
 
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await update.message.reply_text("📋 Все гости, выберите кого отметить:", reply_markup=reply_markup)
+    nav = []
+    if page > 0:
+        nav.append(InlineKeyboardButton("◀", callback_data=f"guests_{page - 1}"))
+    if has_more:
+        nav.append(InlineKeyboardButton("▶", callback_data=f"guests_{page + 1}"))
+    if nav:
+        keyboard.append(nav)
+
+    text = f"📋 Гости, страница {page + 1}. Выберите кого отметить:"
+    return guests, text, InlineKeyboardMarkup(keyboard)
+
+
+@allowed_only
+async def show_guests(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    context.user_data["guest_cursors"] = [None]
+    try:
+        guests, text, reply_markup = await render_guests_page(context, 0)
+    except Exception as e:
+        await update.message.reply_text(f"❌ Ошибка получения списка гостей: {e}")
+        return
+
+    if not guests:
+        await update.message.reply_text("Список гостей пуст.")
+        return
+
+    await update.message.reply_text(text, reply_markup=reply_markup)
 
 
 async def handle_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -585,7 +989,7 @@ async def handle_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return await start(update, context)
 
     elif text == "🔍 Найти гостя":
-        if not await is_allowed(user_id):
+        if not await check_access(update, context):
             await update.message.reply_text("❌ Нет доступа.")
             return
         context.user_data["search_mode"] = True
@@ -595,17 +999,17 @@ async def handle_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     elif text == "📱 Сканировать QR":
-        if not await is_allowed(user_id):
+        if not await check_access(update, context):
             await update.message.reply_text("❌ Нет доступа.")
             return
         context.user_data["mark_mode"] = True
         context.user_data["search_mode"] = False
         context.user_data["add_guest_mode"] = False
-        await update.message.reply_text("Отправьте код из QR:")
+        await update.message.reply_text("Отправьте фото QR-кода или сам код текстом:")
         return
 
     elif text == "👤 Отметить по имени":
-        if not await is_allowed(user_id):
+        if not await check_access(update, context):
             await update.message.reply_text("❌ Нет доступа.")
             return
         context.user_data["search_mode"] = True
@@ -615,14 +1019,14 @@ async def handle_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     elif text == "📤 Загрузить список":
-        if not await is_allowed(user_id):
+        if not await check_access(update, context):
             await update.message.reply_text("❌ Нет доступа.")
             return
         context.user_data["search_mode"] = False
         context.user_data["mark_mode"] = False
         context.user_data["add_guest_mode"] = False
         await update.message.reply_text(
-            "Отправьте Excel-файл (.xlsx/.xls) со столбцами: Код, ФИО"
+            "Отправьте Excel или CSV-файл (.xlsx/.xls/.csv) со столбцами: Код, ФИО"
         )
         return
 
@@ -633,7 +1037,7 @@ async def handle_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return await clear_all_cmd(update, context)
 
     elif text == "➕ Добавить гостя":
-        if not await is_allowed(user_id):
+        if not await check_access(update, context):
             await update.message.reply_text("❌ Нет доступа.")
             return
         context.user_data["search_mode"] = False
@@ -645,7 +1049,7 @@ async def handle_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     elif text == "📋 Показать гостей":
-        if not await is_allowed(user_id):
+        if not await check_access(update, context):
             await update.message.reply_text("❌ Нет доступа.")
             return
         context.user_data["search_mode"] = False
@@ -694,7 +1098,7 @@ async def handle_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Режим добавления одного гостя (только ФИО)
     if context.user_data.get("add_guest_mode"):
-        if not await is_allowed(user_id):
+        if not await check_access(update, context):
             await update.message.reply_text("❌ Нет доступа.")
             return
 
@@ -703,27 +1107,26 @@ async def handle_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("Имя не должно быть пустым. Отправьте ФИО гостя:")
             return
 
-        async with httpx.AsyncClient() as client:
-            try:
-                resp = await client.post(
-                    f"{USERS_SERVICE_URL}/guests",
-                    json={"code": "", "name": name},
-                    timeout=5.0,
-                )
-                if resp.status_code == 400:
-                    await update.message.reply_text("❌ Гость с таким кодом уже существует.")
-                    return
-                resp.raise_for_status()
-            except Exception as e:
-                await update.message.reply_text(f"❌ Ошибка при добавлении гостя: {e}")
+        try:
+            resp = await users_api.post(
+                "/guests",
+                json={"code": "", "name": name},
+                timeout=TIMEOUT_DEFAULT,
+            )
+            if resp.status_code == 400:
+                await update.message.reply_text("❌ Гость с таким кодом уже существует.")
                 return
+            resp.raise_for_status()
+        except Exception as e:
+            await update.message.reply_text(f"❌ Ошибка при добавлении гостя: {e}")
+            return
 
         await update.message.reply_text(f"✅ Гость добавлен:\nИмя: {name}")
         return
 
     # Режим поиска по имени
     if context.user_data.get("search_mode"):
-        if not await is_allowed(user_id):
+        if not await check_access(update, context):
             await update.message.reply_text("❌ Нет доступа.")
             return
 
@@ -732,18 +1135,17 @@ async def handle_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("Введите часть имени гостя:")
             return
 
-        async with httpx.AsyncClient() as client:
-            try:
-                resp = await client.get(
-                    f"{USERS_SERVICE_URL}/search",
-                    params={"query": query_text},
-                    timeout=5.0,
-                )
-                resp.raise_for_status()
-                results = resp.json()
-            except Exception as e:
-                await update.message.reply_text(f"❌ Ошибка поиска: {e}")
-                return
+        try:
+            resp = await users_api.get(
+                "/search",
+                params={"query": query_text},
+                timeout=TIMEOUT_SEARCH,
+            )
+            resp.raise_for_status()
+            results = resp.json()
+        except Exception as e:
+            await update.message.reply_text(f"❌ Ошибка поиска: {e}")
+            return
 
         if not results:
             await update.message.reply_text("❌ Никого не нашли.")
@@ -755,20 +1157,20 @@ async def handle_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 await update.message.reply_text("⚠️ Гость уже пришёл.")
                 return
 
-            async with httpx.AsyncClient() as client:
-                try:
-                    mark_resp = await client.post(
-                        f"{USERS_SERVICE_URL}/mark",
-                        json={"code": r["code"], "method": "search"},
-                        timeout=5.0,
-                    )
-                    mark_resp.raise_for_status()
-                    body = mark_resp.json()
-                    data = body["data"]
-                    already = body.get("already_marked", False)
-                except Exception as e:
-                    await update.message.reply_text(f"❌ Ошибка отметки: {e}")
-                    return
+            try:
+                mark_resp = await users_api.post(
+                    "/mark",
+                    json={"code": r["signed_code"], "method": "search"},
+                    timeout=TIMEOUT_MARK,
+                )
+                mark_resp.raise_for_status()
+                body = mark_resp.json()
+                data = body["data"]
+                already = body.get("already_marked", False)
+            except Exception as e:
+                await update.message.reply_text(f"❌ Ошибка отметки: {e}")
+                return
+            roster_replica.record_mark(data)
 
             if already:
                 await update.message.reply_text("⚠️ Гость уже пришёл.")
@@ -788,7 +1190,7 @@ async def handle_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
             status = "✅" if r["scanned"] else "⏳"
             text_btn = f"{status} {r['name']} ({r['code']})"
             keyboard.append(
-                [InlineKeyboardButton(text_btn, callback_data=f"mark_{r['code']}")]
+                [InlineKeyboardButton(text_btn, callback_data=f"mark_{r['signed_code']}")]
             )
 
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -797,7 +1199,7 @@ async def handle_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Режим отметки по коду
     if context.user_data.get("mark_mode"):
-        if not await is_allowed(user_id):
+        if not await check_access(update, context):
             await update.message.reply_text("❌ Нет доступа.")
             return
 
@@ -805,24 +1207,36 @@ async def handle_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not code:
             await update.message.reply_text("Отправьте код из QR:")
             return
+        guest_code = code_signer.verify(code)
+        if guest_code is None:
+            await update.message.reply_text(INVALID_CODE_TEXT)
+            return
 
-        async with httpx.AsyncClient() as client:
-            try:
-                resp = await client.post(
-                    f"{USERS_SERVICE_URL}/mark",
-                    json={"code": code, "method": "manual"},
-                    timeout=5.0,
-                )
-                if resp.status_code == 404:
-                    await update.message.reply_text("❌ Код не найден в системе.")
-                    return
-                resp.raise_for_status()
-                body = resp.json()
-                data = body["data"]
-                already = body.get("already_marked", False)
-            except Exception as e:
-                await update.message.reply_text(f"❌ Ошибка отметки: {e}")
+        state = await roster_replica.state(guest_code)
+        if state == NOT_FOUND:
+            await update.message.reply_text("❌ Код не найден в системе.")
+            return
+        if state == ALREADY_MARKED:
+            await update.message.reply_text("⚠️ Гость уже пришёл.")
+            return
+
+        try:
+            resp = await users_api.post(
+                "/mark",
+                json={"code": code, "method": "manual"},
+                timeout=TIMEOUT_MARK,
+            )
+            if resp.status_code == 404:
+                await update.message.reply_text("❌ Код не найден в системе.")
                 return
+            resp.raise_for_status()
+            body = resp.json()
+            data = body["data"]
+            already = body.get("already_marked", False)
+        except Exception as e:
+            await update.message.reply_text(f"❌ Ошибка отметки: {e}")
+            return
+        roster_replica.record_mark(data)
 
         if already:
             await update.message.reply_text("⚠️ Гость уже пришёл.")
@@ -839,11 +1253,95 @@ async def handle_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
 
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка апдейтов с сохранением порядка внутри чата.
+
+    Апдейты разных чатов идут одновременно (до max_concurrent_updates),
+    поэтому долгий экспорт у одного оператора не задерживает сканы у других.
+    Апдейты одного чата выполняются строго по очереди прихода.
+
+    Семафор PTB берётся ещё до do_process_update, и апдейты, ждущие замка
+    своего чата, занимали бы места в нём. Поэтому PTB отдаётся заведомо
+    большой лимит, а настоящий проверяется своим семафором уже после замка.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(sys.maxsize)
+        self.limit = max_concurrent_updates
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        self._locks = {}  # chat_id -> [asyncio.Lock, число ожидающих]
+
+    async def do_process_update(self, update, coroutine):
+        key = self._chat_key(update)
+        if key is None:
+            async with self._slots:
+                await coroutine
+            return
+
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self._slots:
+                    await coroutine
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+    @staticmethod
+    def _chat_key(update):
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat:
+            return update.effective_chat.id
+        if update.effective_user:
+            return update.effective_user.id
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+
+async def post_init(application: Application):
+    global users_api, qr_api
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+    users_api = httpx.AsyncClient(base_url=USERS_SERVICE_URL, limits=limits, timeout=TIMEOUT_DEFAULT)
+    qr_api = httpx.AsyncClient(base_url=QR_SERVICE_URL, limits=limits, timeout=TIMEOUT_DECODE)
+    if ROSTER_REPLICA:
+        roster_replica.start(users_api)
+
+
+async def post_shutdown(application: Application):
+    await roster_replica.stop()
+    for client in (users_api, qr_api):
+        if client is not None:
+            await client.aclose()
+
+
 def main():
     if not TELEGRAM_TOKEN:
         raise RuntimeError("TELEGRAM_TOKEN не задан")
 
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(TELEGRAM_TOKEN)
+        .base_url(TELEGRAM_API_URL)
+        .context_types(ContextTypes(context=BotContext))
+        .concurrent_updates(ChatOrderedUpdateProcessor(CONCURRENT_UPDATES))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
 
     application.add_handler(
         MessageHandler(filters.ALL, reject_unauthorized),
@@ -856,15 +1354,34 @@ def main():
     application.add_handler(CommandHandler("add_tg_user", add_tg_user_cmd), group=1)
     application.add_handler(CommandHandler("find", find), group=1)
     application.add_handler(CommandHandler("export", send_reports), group=1)
+    application.add_handler(CommandHandler("qr_codes", send_qr_codes), group=1)
     application.add_handler(CommandHandler("clear_all", clear_all_cmd), group=1)
     application.add_handler(CallbackQueryHandler(button), group=1)
+    # Фото и картинки-документы — до общего обработчика документов
+    application.add_handler(
+        MessageHandler(filters.PHOTO | filters.Document.IMAGE, handle_photo),
+        group=1,
+    )
     application.add_handler(MessageHandler(filters.Document.ALL, handle_file), group=1)
     application.add_handler(
         MessageHandler(filters.TEXT & ~filters.COMMAND, handle_menu),
         group=1,
     )
 
-    application.run_polling()
+    if BOT_MODE == "webhook":
+        if not WEBHOOK_URL or not WEBHOOK_SECRET:
+            raise RuntimeError("Для webhook нужны WEBHOOK_URL и WEBHOOK_SECRET")
+        # Telegram присылает секрет в заголовке X-Telegram-Bot-Api-Secret-Token,
+        # запросы без него PTB отклоняет
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET,
+        )
+    else:
+        application.run_polling()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,92 @@
+"""Задержка отметки (POST /mark) из бота: новый AsyncClient на запрос против общего клиента.
+
+Поднимает users_service во временной папке и отмечает одних и тех же гостей
+(повторные сканирования) двумя способами. Параллельность — как у нескольких
+операторов, сканирующих одновременно.
+
+Запуск из корня репозитория:
+    python gateway/telegram_bot/benchmarks/bench_http_client.py [--scans 500] [--concurrency 8]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+sys.path.insert(0, os.path.join(ROOT, "services", "users_service", "benchmarks"))
+
+from bench_mark import free_port, percentile, start_service  # noqa: E402
+
+
+async def run(scans: int, concurrency: int, scan) -> list:
+    codes = [f"G{i % 100}" for i in range(scans)]
+    latencies = []
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(code):
+        async with sem:
+            started = time.perf_counter()
+            resp = await scan(code)
+            resp.raise_for_status()
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*(one(code) for code in codes))
+    return latencies
+
+
+def report(label: str, latencies: list, wall: float):
+    print(
+        f"{label:<22} p50={statistics.median(latencies):6.2f}ms "
+        f"p90={percentile(latencies, 90):6.2f}ms p99={percentile(latencies, 99):6.2f}ms "
+        f"throughput={len(latencies) / wall:6.0f}/s"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scans", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        port = free_port()
+        url = f"http://127.0.0.1:{port}"
+        proc = start_service(workdir, port)
+        try:
+            async with httpx.AsyncClient(base_url=url) as client:
+                for i in range(100):
+                    await client.post("/guests", json={"code": f"G{i}", "name": f"Гость {i}"})
+
+            async def per_call(code):
+                async with httpx.AsyncClient() as client:
+                    return await client.post(f"{url}/mark", json={"code": code, "method": "qr"}, timeout=5.0)
+
+            shared = httpx.AsyncClient(
+                base_url=url,
+                limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+            )
+
+            async def pooled(code):
+                return await shared.post("/mark", json={"code": code, "method": "qr"}, timeout=5.0)
+
+            # Прогрев: первые соединения и кэши сервиса
+            await run(50, args.concurrency, pooled)
+
+            for label, scan in (("new client per call", per_call), ("shared pooled client", pooled)):
+                started = time.perf_counter()
+                latencies = await run(args.scans, args.concurrency, scan)
+                report(label, latencies, time.perf_counter() - started)
+
+            await shared.aclose()
+        finally:
+            proc.terminate()
+            proc.wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
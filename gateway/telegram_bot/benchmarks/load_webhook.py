@@ -0,0 +1,235 @@
+"""Нагрузочный тест webhook-режима бота: задержка «скан → ответ» при N операторах.
+
+Поднимает во временной папке users_service, локальный фейковый Bot API
+и сам бот в режиме webhook. Каждый оператор — отдельный чат, шлёт /mark CODE
+и ждёт ответного sendMessage, после чего сканирует следующий код.
+С --rescans каждый код сканируется повторно, как при очереди у входа:
+эти ответы («гость уже пришёл») считаются отдельно.
+Параллельно администратор запрашивает /export, а фейковый Bot API отдаёт
+sendDocument с задержкой --upload-delay, как медленная загрузка файла.
+
+Запуск из корня репозитория:
+    python gateway/telegram_bot/benchmarks/load_webhook.py [--operators 50] [--scans 20]
+                                                          [--concurrent-updates 64] [--rescans 0]
+                                                          [--env DB_PROFILE=production ...]
+                                                          [--bot-env ROSTER_REPLICA=0 ...]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+BOT_DIR = os.path.join(ROOT, "gateway", "telegram_bot")
+sys.path.insert(0, os.path.join(ROOT, "services", "users_service", "benchmarks"))
+
+from bench_mark import COMMON_DIR, free_port, percentile, start_service  # noqa: E402
+
+TOKEN = "123456:TEST"
+SECRET = "load-test-secret"
+ADMIN_ID = 5502429477
+OPERATOR_BASE_ID = 1_000_000
+
+
+class FakeTelegram:
+    """Минимальный Bot API: отвечает на вызовы бота и сообщает о его ответах в чаты."""
+
+    def __init__(self, upload_delay: float):
+        self.upload_delay = upload_delay
+        self.waiters = {}  # chat_id -> asyncio.Future с текстом ответа
+        self.message_ids = itertools.count(1)
+        self.app = FastAPI()
+        self.app.add_api_route("/bot{token}/{method}", self.handle, methods=["POST", "GET"])
+
+    async def handle(self, token: str, method: str, request: Request):
+        params = dict(await request.form())
+        if method == "getMe":
+            return {"ok": True, "result": {"id": 1, "is_bot": True, "first_name": "QR", "username": "qr_bot"}}
+        if method in ("setWebhook", "deleteWebhook", "answerCallbackQuery"):
+            return {"ok": True, "result": True}
+        if method == "sendDocument":
+            await asyncio.sleep(self.upload_delay)
+
+        chat_id = int(params.get("chat_id", 0))
+        text = params.get("text") or params.get("caption") or ""
+        future = self.waiters.pop(chat_id, None)
+        if future is not None and not future.done():
+            future.set_result(text)
+        return {
+            "ok": True,
+            "result": {
+                "message_id": next(self.message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": text,
+            },
+        }
+
+    def expect_reply(self, chat_id: int) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self.waiters[chat_id] = future
+        return future
+
+
+update_ids = itertools.count(1)
+
+
+def command_update(chat_id: int, text: str) -> dict:
+    command = text.split()[0]
+    return {
+        "update_id": next(update_ids),
+        "message": {
+            "message_id": next(update_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Operator"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(command)}],
+        },
+    }
+
+
+async def wait_http(url: str, attempts: int = 100):
+    async with httpx.AsyncClient() as client:
+        for _ in range(attempts):
+            try:
+                await client.get(url, timeout=1.0)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} did not start")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--operators", type=int, default=50)
+    parser.add_argument("--scans", type=int, default=20, help="сканов на оператора")
+    parser.add_argument("--concurrent-updates", type=int, default=64)
+    parser.add_argument("--upload-delay", type=float, default=3.0)
+    parser.add_argument("--exports", type=int, default=3)
+    parser.add_argument("--rescans", type=int, default=0, help="повторных сканов каждого кода")
+    parser.add_argument("--env", action="append", default=[], help="KEY=VALUE для users_service")
+    parser.add_argument("--bot-env", action="append", default=[], help="KEY=VALUE для бота")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        users_port, tg_port, hook_port = free_port(), free_port(), free_port()
+        users_url = f"http://127.0.0.1:{users_port}"
+        users = start_service(workdir, users_port, dict(item.split("=", 1) for item in args.env))
+
+        fake = FakeTelegram(args.upload_delay)
+        tg_server = uvicorn.Server(uvicorn.Config(fake.app, port=tg_port, log_level="warning"))
+        tg_task = asyncio.create_task(tg_server.serve())
+
+        bot = None
+        try:
+            operators = [OPERATOR_BASE_ID + i for i in range(args.operators)]
+            async with httpx.AsyncClient(base_url=users_url) as client:
+                for i in range(args.operators * args.scans):
+                    await client.post("/guests", json={"code": f"G{i}", "name": f"Гость {i}"})
+                for op in operators:
+                    await client.post("/tg_users", json={"telegram_id": op, "name": f"Оператор {op}"})
+
+            await wait_http(f"http://127.0.0.1:{tg_port}/bot{TOKEN}/getMe")
+            hook_url = f"http://127.0.0.1:{hook_port}/telegram"
+            bot = subprocess.Popen(
+                [sys.executable, "app.py"],
+                cwd=BOT_DIR,
+                env={
+                    **os.environ,
+                    "PYTHONPATH": COMMON_DIR,
+                    "TELEGRAM_TOKEN": TOKEN,
+                    "TELEGRAM_API_URL": f"http://127.0.0.1:{tg_port}/bot",
+                    "USERS_SERVICE_URL": users_url,
+                    "BOT_MODE": "webhook",
+                    "WEBHOOK_URL": hook_url,
+                    "WEBHOOK_LISTEN": "127.0.0.1",
+                    "WEBHOOK_PORT": str(hook_port),
+                    "WEBHOOK_SECRET": SECRET,
+                    "CONCURRENT_UPDATES": str(args.concurrent_updates),
+                    **dict(item.split("=", 1) for item in args.bot_env),
+                },
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            await wait_http(hook_url)
+
+            headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+            async with httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=args.operators + 10)
+            ) as hook:
+                # Без секрета PTB отвечает 403
+                resp = await hook.post(hook_url, json=command_update(operators[0], "/start"))
+                print(f"webhook without secret token: HTTP {resp.status_code}")
+
+                async def send(chat_id: int, text: str):
+                    resp = await hook.post(hook_url, json=command_update(chat_id, text), headers=headers)
+                    resp.raise_for_status()
+
+                async def scan(chat_id: int, code: str, expected: str) -> float:
+                    reply = fake.expect_reply(chat_id)
+                    started = time.perf_counter()
+                    await send(chat_id, f"/mark {code}")
+                    text = await asyncio.wait_for(reply, timeout=120)
+                    assert expected in text, text
+                    return (time.perf_counter() - started) * 1000
+
+                async def operator(index: int, chat_id: int) -> tuple:
+                    latencies, repeat_latencies = [], []
+                    for n in range(args.scans):
+                        code = f"G{index * args.scans + n}"
+                        latencies.append(await scan(chat_id, code, "Отметка сохранена"))
+                        for _ in range(args.rescans):
+                            repeat_latencies.append(await scan(chat_id, code, "уже пришёл"))
+                    return latencies, repeat_latencies
+
+                async def exports():
+                    for _ in range(args.exports):
+                        await send(ADMIN_ID, "/export")
+
+                started = time.perf_counter()
+                results = await asyncio.gather(
+                    exports(),
+                    *(operator(i, op) for i, op in enumerate(operators)),
+                )
+                wall = time.perf_counter() - started
+
+            latencies = [t for first, _ in results[1:] for t in first]
+            repeat_latencies = [t for _, repeats in results[1:] for t in repeats]
+            stats = httpx.get(f"{users_url}/stats").json()
+        finally:
+            if bot is not None:
+                bot.terminate()
+                bot.wait()
+            tg_server.should_exit = True
+            await tg_task
+            users.terminate()
+            users.wait()
+
+    print(
+        f"operators={args.operators} scans={len(latencies)} concurrent_updates={args.concurrent_updates} "
+        f"exports={args.exports} upload_delay={args.upload_delay}s"
+    )
+    print(f"users_service stats: {json.dumps(stats, ensure_ascii=False)}")
+    print(f"throughput: {(len(latencies) + len(repeat_latencies)) / wall:.0f} scans/s")
+    for label, values in (("scan-to-reply", latencies), ("repeat scan", repeat_latencies)):
+        if values:
+            print(
+                f"{label} ms: p50={statistics.median(values):.1f} "
+                f"p90={percentile(values, 90):.1f} p99={percentile(values, 99):.1f} "
+                f"max={max(values):.1f}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
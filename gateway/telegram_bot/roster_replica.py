@@ -0,0 +1,150 @@
+import asyncio
+import logging
+from typing import Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+NOT_FOUND = "not_found"
+ALREADY_MARKED = "already_marked"
+
+
+class RosterReplica:
+    """Список гостей и первые отметки в памяти бота, по журналу GET /changes.
+
+    Фоновая задача догоняет журнал каждые interval секунд. По реплике бот
+    сразу отвечает «код не найден» и «гость уже пришёл», а в users_service
+    идёт только за первой отметкой гостя.
+    """
+
+    def __init__(self, interval: float, page_size: int, timeout: httpx.Timeout):
+        self.interval = interval
+        self.page_size = page_size
+        self.timeout = timeout
+        self.epoch: Optional[int] = None
+        self.seq = 0
+        self.ready = False
+        self.guests: Dict[str, str] = {}  # code -> name
+        self.marks: Dict[str, dict] = {}  # code -> первая отметка
+        self.syncs = 0
+        self._client: Optional[httpx.AsyncClient] = None
+        self._sync_task: Optional[asyncio.Task] = None
+        self._loop_task: Optional[asyncio.Task] = None
+
+    def start(self, client: httpx.AsyncClient):
+        self._client = client
+        self._loop_task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        for task in (self._loop_task, self._sync_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.warning(f"Roster replica sync failed at seq {self.seq}: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def sync(self):
+        """Догоняет журнал; одновременные вызовы ждут одну синхронизацию."""
+        if self._sync_task is None or self._sync_task.done():
+            self._sync_task = asyncio.create_task(self._sync())
+        await asyncio.shield(self._sync_task)
+
+    async def refresh(self):
+        """Синхронизация, начатая не раньше вызова: видны все изменения до него."""
+        task = self._sync_task
+        if task is not None and not task.done():
+            try:
+                await asyncio.shield(task)
+            except Exception:
+                pass
+        await self.sync()
+
+    async def _sync(self):
+        while True:
+            resp = await self._client.get(
+                "/changes",
+                params={"since": self.seq, "limit": self.page_size},
+                timeout=self.timeout,
+            )
+            resp.raise_for_status()
+            body = resp.json()
+
+            if body["epoch"] != self.epoch:
+                known = self.epoch is not None
+                self.epoch = body["epoch"]
+                if known:
+                    # Базу пересоздали: номера начались заново и могли уже
+                    # обогнать наш seq — читаем журнал с нуля
+                    logger.warning(f"Change feed epoch changed at replica seq {self.seq}, resyncing")
+                    self._reset()
+                    continue
+            if self.seq > body["head"]:
+                logger.warning(f"Change feed head {body['head']} is behind replica seq {self.seq}, resyncing")
+                self._reset()
+                continue
+
+            for change in body["changes"]:
+                self._apply(change)
+            self.seq = body["last_seq"]
+            if not body["has_more"]:
+                break
+
+        self.syncs += 1
+        if not self.ready:
+            logger.info(f"Roster replica ready: {len(self.guests)} guests, {len(self.marks)} marked, seq {self.seq}")
+        self.ready = True
+
+    def _reset(self):
+        self.seq = 0
+        self.guests.clear()
+        self.marks.clear()
+
+    def _apply(self, change: dict):
+        kind = change["kind"]
+        if kind == "guest_add":
+            self.guests[change["code"]] = change["name"]
+        elif kind == "mark":
+            self.record_mark(change)
+        elif kind == "clear":
+            self.guests.clear()
+            self.marks.clear()
+
+    def record_mark(self, data: dict):
+        """Первая отметка из журнала или из ответа POST /mark."""
+        self.guests.setdefault(data["code"], data["name"])
+        self.marks.setdefault(data["code"], {
+            "name": data["name"],
+            "timestamp": data["timestamp"],
+            "method": data["method"],
+        })
+
+    async def state(self, code: str) -> Optional[str]:
+        """NOT_FOUND, ALREADY_MARKED или None — нужен POST /mark.
+
+        Неизвестный код перед ответом «не найден» один раз досинхронизируется:
+        гость мог быть добавлен только что. Пока реплика не готова или
+        users_service недоступен, решение оставляется за /mark.
+        """
+        if not self.ready:
+            return None
+        if code not in self.guests:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning(f"Roster replica refresh failed: {e}")
+                return None
+            if code not in self.guests:
+                return NOT_FOUND
+        if code in self.marks:
+            return ALREADY_MARKED
+        return None
@@ -0,0 +1,107 @@
+"""Пропускная способность распознавания QR: изображений в секунду на ядро.
+
+Генерирует снимки, похожие на фото с телефона: QR-код гостя на большом
+зашумлённом фоне, немного повёрнутый, в JPEG. Сравнивает декодирование
+оригинала без подготовки и с подготовкой (серый + уменьшение), а также
+пул процессов.
+
+Нужен пакет qrcode (pip install qrcode). Запуск из services/qr_service:
+    python benchmarks/bench_decode.py [--images 60] [--size 3000x2250] [--workers N]
+"""
+import argparse
+import asyncio
+import io
+import os
+import random
+import sys
+import time
+
+import cv2
+import numpy as np
+import qrcode
+from PIL import Image, ImageFilter
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from decoder import _detect, decode_image  # noqa: E402
+from worker_pool import WorkerPool  # noqa: E402
+
+
+def make_photo(code: str, width: int, height: int) -> bytes:
+    qr = qrcode.make(code, box_size=10, border=4).convert("L")
+    side = random.randint(min(width, height) // 4, min(width, height) // 2)
+    qr = qr.resize((side, side)).rotate(random.uniform(-15, 15), expand=True, fillcolor=255)
+
+    noise = np.random.normal(140, 30, (height // 8, width // 8)).clip(0, 255).astype("uint8")
+    background = Image.fromarray(noise).resize((width, height)).filter(ImageFilter.GaussianBlur(2))
+    background = background.convert("RGB")
+    x = random.randint(0, width - qr.width)
+    y = random.randint(0, height - qr.height)
+    background.paste(qr.convert("RGB"), (x, y))
+
+    buf = io.BytesIO()
+    background.save(buf, "JPEG", quality=85)
+    return buf.getvalue()
+
+
+def decode_original(data: bytes) -> list:
+    # Как без подготовки: полноразмерная цветная картинка прямо в детектор
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    return _detect(image)
+
+
+def run_serial(label: str, images: list, codes: list, decode):
+    started = time.perf_counter()
+    ok = sum(1 for data, code in zip(images, codes) if code in decode(data))
+    elapsed = time.perf_counter() - started
+    print(f"{label:<32} {len(images) / elapsed:7.1f} img/s  (1 core)  decoded {ok}/{len(images)}")
+
+
+async def decode_all(pool: WorkerPool, images: list, max_side: int) -> list:
+    return await asyncio.gather(
+        *(pool.run(decode_image, data, max_side) for data in images),
+        return_exceptions=True,
+    )
+
+
+async def run_pool(images: list, codes: list, workers: int, max_side: int):
+    pool = WorkerPool(workers)
+    pool.start()
+    try:
+        await decode_all(pool, images[:workers], max_side)  # прогрев процессов
+        started = time.perf_counter()
+        results = await decode_all(pool, images, max_side)
+        elapsed = time.perf_counter() - started
+    finally:
+        pool.shutdown()
+    ok = sum(1 for r, code in zip(results, codes) if not isinstance(r, Exception) and code in r)
+    rate = len(images) / elapsed
+    print(
+        f"{'pool, ' + str(workers) + ' workers':<32} {rate:7.1f} img/s  "
+        f"({rate / workers:.1f} per core)  decoded {ok}/{len(images)}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=60)
+    parser.add_argument("--size", default="3000x2250")
+    parser.add_argument("--max-side", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    random.seed(1)
+    np.random.seed(1)
+    cv2.setNumThreads(1)
+    width, height = (int(v) for v in args.size.split("x"))
+    codes = [f"G{i:05d}" for i in range(args.images)]
+    images = [make_photo(code, width, height) for code in codes]
+    print(f"{args.images} JPEG photos {width}x{height}, avg {sum(map(len, images)) // len(images) // 1024} KB")
+
+    run_serial("original, no preprocessing", images, codes, decode_original)
+    run_serial(f"gray + downscale to {args.max_side}px", images, codes, lambda d: decode_image(d, args.max_side))
+    asyncio.run(run_pool(images, codes, args.workers, args.max_side))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Бенчмарк /generate: холодный (пустой кэш) и повторный прогон.
+
+Поднимает во временной папке users_service с N гостями и qr_service,
+скачивает архив потоково, проверяет число файлов и распознаёт часть
+кодов обратно.
+
+Запуск из корня репозитория:
+    python services/qr_service/benchmarks/bench_generate.py [--guests 2000] [--workers 2]
+"""
+import argparse
+import io
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+import httpx
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+SERVICE_DIR = os.path.join(ROOT, "services", "qr_service")
+sys.path.insert(0, SERVICE_DIR)
+sys.path.insert(0, os.path.join(ROOT, "services", "users_service", "benchmarks"))
+
+from bench_mark import COMMON_DIR, free_port, start_service  # noqa: E402
+from decoder import decode_image  # noqa: E402
+
+
+def start_qr_service(workdir: str, port: int, users_url: str, workers: int) -> subprocess.Popen:
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=SERVICE_DIR,
+        env={
+            **os.environ,
+            "PYTHONPATH": COMMON_DIR,
+            "USERS_SERVICE_URL": users_url,
+            "QR_WORKERS": str(workers),
+            "QR_CACHE_DIR": os.path.join(workdir, "qr_cache"),
+        },
+    )
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/health", timeout=1.0)
+            return proc
+        except httpx.TransportError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("qr_service did not start")
+
+
+def download(url: str, style: str) -> tuple:
+    started = time.perf_counter()
+    first_byte = None
+    buf = io.BytesIO()
+    with httpx.stream("GET", f"{url}/generate", params={"style": style}, timeout=600) as resp:
+        resp.raise_for_status()
+        for chunk in resp.iter_bytes():
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+            buf.write(chunk)
+    return time.perf_counter() - started, first_byte, buf.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--guests", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        users_port, qr_port = free_port(), free_port()
+        users_url = f"http://127.0.0.1:{users_port}"
+        qr_url = f"http://127.0.0.1:{qr_port}"
+        users = start_service(workdir, users_port)
+        qr = None
+        try:
+            with httpx.Client(base_url=users_url) as client:
+                for i in range(args.guests):
+                    client.post("/guests", json={"code": f"G{i:05d}", "name": f"Гость Тестовый {i}"})
+            qr = start_qr_service(workdir, qr_port, users_url, args.workers)
+
+            print(f"guests={args.guests} workers={args.workers}")
+            for style in ("plain", "badge"):
+                for run in ("cold", "warm"):
+                    elapsed, first_byte, data = download(qr_url, style)
+                    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                        names = archive.namelist()
+                        sample = random.sample(names, min(20, len(names)))
+                        ok = sum(
+                            1 for name in sample
+                            if decode_image(archive.read(name), 1000) == [name[:-4]]
+                        )
+                    print(
+                        f"{style:<6} {run:<5} {elapsed:6.2f}s  {len(names) / elapsed:7.0f} codes/s  "
+                        f"first byte {first_byte * 1000:6.0f} ms  {len(data) / 1e6:5.1f} MB  "
+                        f"files {len(names)}  decoded {ok}/{len(sample)}"
+                    )
+        finally:
+            if qr is not None:
+                qr.terminate()
+                qr.wait()
+            users.terminate()
+            users.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+import os
+
+USERS_SERVICE_URL = os.getenv("USERS_SERVICE_URL", "http://users_service:8000")
+
+# Число процессов для распознавания и генерации (по умолчанию — по числу ядер)
+QR_WORKERS = int(os.getenv("QR_WORKERS", "0")) or os.cpu_count() or 1
+
+# Распознавание QR
+# Длинная сторона изображения после уменьшения, пикселей
+QR_MAX_SIDE = int(os.getenv("QR_MAX_SIDE", "1000"))
+QR_MAX_IMAGE_BYTES = int(os.getenv("QR_MAX_IMAGE_BYTES", str(10 * 1024 * 1024)))
+QR_BATCH_MAX = int(os.getenv("QR_BATCH_MAX", "32"))
+
+# Генерация QR и бейджей
+# Ключ подписи кодов — тот же, что у users_service и бота (пусто — без подписи)
+CODE_SIGNING_KEY = os.getenv("CODE_SIGNING_KEY", "")
+QR_CACHE_DIR = os.getenv("QR_CACHE_DIR", "./qr_cache")
+QR_FONT_PATH = os.getenv("QR_FONT_PATH", "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf")
+# Гостей за один запрос к users_service (не больше его GUESTS_PAGE_MAX)
+QR_GENERATE_PAGE_SIZE = int(os.getenv("QR_GENERATE_PAGE_SIZE", "500"))
@@ -0,0 +1,62 @@
+import io
+from typing import List, Optional
+
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+
+# Детекторы создаются один раз на процесс пула
+_detectors: Optional[list] = None
+
+
+def _get_detectors() -> list:
+    global _detectors
+    if _detectors is None:
+        # Классический детектор быстрее; детектор на основе ArUco находит
+        # часть мелких и плотных кодов, которые классический пропускает
+        _detectors = [cv2.QRCodeDetector(), cv2.QRCodeDetectorAruco()]
+    return _detectors
+
+
+def _detect(gray: np.ndarray) -> List[str]:
+    for detector in _get_detectors():
+        found, payloads, _, _ = detector.detectAndDecodeMulti(gray)
+        codes = [p for p in payloads if p] if found else []
+        if not codes:
+            payload, _, _ = detector.detectAndDecode(gray)
+            if payload:
+                codes = [payload]
+        if codes:
+            return list(dict.fromkeys(codes))
+    return []
+
+
+def load_gray(data: bytes, max_side: int) -> Image.Image:
+    """Изображение в оттенках серого с учётом поворота из EXIF.
+
+    Для JPEG draft() распаковывает картинку сразу в уменьшенном масштабе,
+    не разжимая все пиксели оригинала.
+    """
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.draft("L", (max_side, max_side))
+        image = ImageOps.exif_transpose(image)
+        return image.convert("L")
+    except Exception as e:
+        raise ValueError(f"Не удалось прочитать изображение: {str(e)}")
+
+
+def decode_image(data: bytes, max_side: int) -> List[str]:
+    """Содержимое всех QR-кодов на изображении (пустой список, если их нет)."""
+    gray = load_gray(data, max_side)
+
+    small = gray
+    if max(gray.size) > max_side:
+        small = gray.copy()
+        small.thumbnail((max_side, max_side), Image.BILINEAR)
+
+    codes = _detect(np.asarray(small))
+    if not codes and small is not gray:
+        # Мелкий код на большом снимке мог потеряться при уменьшении
+        codes = _detect(np.asarray(gray))
+    return codes
@@ -0,0 +1,159 @@
+import hashlib
+import io
+import os
+import re
+import zipfile
+from functools import lru_cache
+
+import qrcode
+from PIL import Image, ImageDraw, ImageFont
+
+STYLES = ("plain", "badge")
+
+# Увеличить при изменении внешнего вида: старые файлы кэша перестанут совпадать
+RENDER_VERSION = 1
+
+BOX_SIZE = 10
+BORDER = 4
+BADGE_PADDING = 24
+NAME_FONT_SIZE = 36
+CODE_FONT_SIZE = 24
+MIN_FONT_SIZE = 16
+
+
+def cache_path(cache_dir: str, payload: str, name: str, style: str) -> str:
+    """Файл кэша для (содержимое QR, style); для бейджа в ключ входит и имя.
+
+    В содержимое входит подпись кода, так что смена ключа не подсунет старые картинки.
+    """
+    key = f"{RENDER_VERSION}|{style}|{payload}|{name if style == 'badge' else ''}"
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+    # Подкаталоги по первым символам, чтобы не держать десятки тысяч файлов в одном
+    return os.path.join(cache_dir, digest[:2], f"{digest}.png")
+
+
+def archive_name(code: str) -> str:
+    """Имя PNG в архиве. Если в коде были недопустимые символы, к имени
+    добавляется хэш исходного кода: иначе A/1 и A_1 дали бы один файл."""
+    safe = re.sub(r"[^\w.-]", "_", code)
+    if safe != code:
+        safe += "-" + hashlib.sha256(code.encode("utf-8")).hexdigest()[:8]
+    return safe + ".png"
+
+
+@lru_cache(maxsize=None)
+def _font(font_path: str, size: int) -> ImageFont.ImageFont:
+    try:
+        return ImageFont.truetype(font_path, size)
+    except OSError:
+        # Встроенный шрифт без кириллицы, но бейдж хотя бы отрисуется
+        return ImageFont.load_default(size)
+
+
+def _fit_text(draw: ImageDraw.ImageDraw, text: str, font_path: str, size: int, width: int):
+    """Уменьшает шрифт до MIN_FONT_SIZE, а если и так не влезает — обрезает текст."""
+    while size > MIN_FONT_SIZE and draw.textlength(text, font=_font(font_path, size)) > width:
+        size -= 2
+    font = _font(font_path, size)
+    if draw.textlength(text, font=font) > width:
+        while len(text) > 1 and draw.textlength(text + "…", font=font) > width:
+            text = text[:-1]
+        text += "…"
+    return text, font
+
+
+def render_qr(payload: str) -> Image.Image:
+    qr = qrcode.QRCode(
+        error_correction=qrcode.constants.ERROR_CORRECT_M,
+        box_size=BOX_SIZE,
+        border=BORDER,
+    )
+    qr.add_data(payload)
+    qr.make(fit=True)
+    # Однобитный PNG: вдвое меньше и быстрее сохраняется, чем в оттенках серого
+    return qr.make_image(fill_color="black", back_color="white").get_image()
+
+
+def render_badge(payload: str, code: str, name: str, font_path: str) -> Image.Image:
+    """QR-код с именем гостя и кодом под ним (код — без подписи, для людей)."""
+    qr = render_qr(payload)
+    width = qr.width
+    text_width = width - 2 * BADGE_PADDING
+
+    measure = ImageDraw.Draw(qr)
+    name, name_font = _fit_text(measure, name, font_path, NAME_FONT_SIZE, text_width)
+    code_font = _font(font_path, CODE_FONT_SIZE)
+
+    height = qr.height + NAME_FONT_SIZE + CODE_FONT_SIZE + 2 * BADGE_PADDING
+    badge = Image.new("L", (width, height), 255)
+    badge.paste(qr, (0, 0))
+
+    draw = ImageDraw.Draw(badge)
+    y = qr.height
+    draw.text((width / 2, y), name, font=name_font, fill=0, anchor="mt")
+    y += NAME_FONT_SIZE + BADGE_PADDING // 2
+    draw.text((width / 2, y), code, font=code_font, fill=80, anchor="mt")
+    return badge
+
+
+def render_to_file(payload: str, code: str, name: str, style: str, path: str, font_path: str) -> str:
+    """Отрисовка в файл кэша; выполняется в процессе пула, наружу — только путь."""
+    if style == "badge":
+        image = render_badge(payload, code, name, font_path)
+    else:
+        image = render_qr(payload)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Запись через временный файл: параллельный запрос не прочитает недописанный PNG
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    image.save(tmp_path, "PNG")
+    os.replace(tmp_path, path)
+    return path
+
+
+class _Sink(io.RawIOBase):
+    """Файл только на запись без seek: zipfile пишет в него потоково."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ZipStream:
+    """ZIP-архив, который отдаётся кусками по мере добавления файлов.
+
+    В архиве без seek zipfile пишет размеры в дескриптор после данных,
+    поэтому целиком в памяти архив не держится. PNG уже сжаты — без
+    повторного сжатия (ZIP_STORED).
+    """
+
+    def __init__(self):
+        self._sink = _Sink()
+        self._zip = zipfile.ZipFile(self._sink, mode="w", compression=zipfile.ZIP_STORED)
+        self._names = set()
+
+    def add(self, name: str, data: bytes) -> bytes:
+        # Повтор имени при распаковке молча перезапишет файл — добавляем номер
+        stem, ext = os.path.splitext(name)
+        n = 1
+        while name in self._names:
+            n += 1
+            name = f"{stem}~{n}{ext}"
+        self._names.add(name)
+        self._zip.writestr(name, data)
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        self._zip.close()
+        return self._sink.drain()
@@ -0,0 +1,196 @@
+from fastapi import FastAPI, HTTPException, Query, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import AsyncIterator, List, Literal, Optional
+import asyncio
+import logging
+import os
+
+import httpx
+
+import config
+from code_signing import CodeSigner
+from decoder import decode_image
+from generator import ZipStream, archive_name, cache_path, render_to_file
+from worker_pool import WorkerPool
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+worker_pool = WorkerPool(config.QR_WORKERS)
+# Здесь коды только выдаются, флаг приёма кодов без подписи не нужен
+code_signer = CodeSigner(config.CODE_SIGNING_KEY, accept_plain=True)
+
+# Создаётся в lifespan
+users_api: Optional[httpx.AsyncClient] = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global users_api
+    worker_pool.start()
+    users_api = httpx.AsyncClient(base_url=config.USERS_SERVICE_URL, timeout=30.0)
+    yield
+    await users_api.aclose()
+    worker_pool.shutdown()
+
+
+app = FastAPI(title="QR Service", version="0.1.0", lifespan=lifespan)
+
+
+async def read_image(file: UploadFile) -> bytes:
+    data = await file.read(config.QR_MAX_IMAGE_BYTES + 1)
+    if len(data) > config.QR_MAX_IMAGE_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Изображение больше {config.QR_MAX_IMAGE_BYTES // (1024 * 1024)} МБ",
+        )
+    return data
+
+
+@app.get("/health")
+def health_check():
+    return {"status": "ok", "service": "qr_service"}
+
+
+@app.post("/decode")
+async def decode(file: UploadFile = File(...)):
+    data = await read_image(file)
+    try:
+        codes = await worker_pool.run(decode_image, data, config.QR_MAX_SIDE)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    logger.info(f"Decoded {len(codes)} QR codes from {file.filename}")
+    return {"codes": codes}
+
+
+@app.post("/decode/batch")
+async def decode_batch(files: List[UploadFile] = File(...)):
+    if len(files) > config.QR_BATCH_MAX:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Слишком много изображений в одном запросе (максимум {config.QR_BATCH_MAX})",
+        )
+
+    images = [await read_image(f) for f in files]
+    decoded = await asyncio.gather(
+        *(worker_pool.run(decode_image, data, config.QR_MAX_SIDE) for data in images),
+        return_exceptions=True,
+    )
+
+    results = []
+    for f, codes in zip(files, decoded):
+        if isinstance(codes, Exception):
+            results.append({"filename": f.filename, "codes": [], "error": str(codes)})
+        else:
+            results.append({"filename": f.filename, "codes": codes, "error": None})
+
+    logger.info(f"Batch decode: {len(files)} images")
+    return {"results": results}
+
+
+async def guest_pages() -> AsyncIterator[list]:
+    """Весь список гостей users_service страницами по keyset-курсору."""
+    params = {"limit": config.QR_GENERATE_PAGE_SIZE}
+    while True:
+        resp = await users_api.get("/guests", params=params)
+        resp.raise_for_status()
+        guests = resp.json()
+        if guests:
+            yield guests
+        if len(guests) < config.QR_GENERATE_PAGE_SIZE:
+            return
+        params["after_name"] = guests[-1]["name"]
+        params["after_code"] = guests[-1]["code"]
+
+
+class GenerateRun:
+    """Один проход генерации: отрисовка недостающих файлов и сборка ZIP."""
+
+    def __init__(self, style: str):
+        self.style = style
+        self.total = 0
+        self.rendered = 0
+
+    async def prepare(self, guests: list) -> list:
+        """(имя в архиве, PNG) для страницы; промахи кэша рисуются в пуле процессов."""
+        payloads = [code_signer.sign(g["code"]) for g in guests]
+        paths = [
+            cache_path(config.QR_CACHE_DIR, payload, g["name"], self.style)
+            for g, payload in zip(guests, payloads)
+        ]
+        missing = [
+            (g, payload, path) for g, payload, path in zip(guests, payloads, paths)
+            if not os.path.exists(path)
+        ]
+        await asyncio.gather(*(
+            worker_pool.run(
+                render_to_file, payload, g["code"], g["name"], self.style, path, config.QR_FONT_PATH
+            )
+            for g, payload, path in missing
+        ))
+        self.total += len(guests)
+        self.rendered += len(missing)
+        return await run_in_threadpool(self._read, guests, paths)
+
+    @staticmethod
+    def _read(guests: list, paths: list) -> list:
+        entries = []
+        for g, path in zip(guests, paths):
+            with open(path, "rb") as f:
+                entries.append((archive_name(g["code"]), f.read()))
+        return entries
+
+    async def stream(self, pages: AsyncIterator[list], first: list) -> AsyncIterator[bytes]:
+        archive = ZipStream()
+        # Следующая страница рисуется, пока текущая уходит клиенту
+        task = asyncio.create_task(self.prepare(first))
+        try:
+            while task is not None:
+                entries = await task
+                page = await anext(pages, None)
+                task = asyncio.create_task(self.prepare(page)) if page else None
+                for name, data in entries:
+                    yield archive.add(name, data)
+            yield archive.close()
+            logger.info(
+                f"Generated {self.style} archive: {self.total} codes, "
+                f"{self.rendered} rendered, {self.total - self.rendered} from cache"
+            )
+        except Exception as e:
+            # Заголовки уже отправлены — остаётся оборвать архив
+            logger.error(f"QR archive generation failed after {self.total} codes: {e}")
+            raise
+        finally:
+            if task is not None:
+                task.cancel()
+
+
+@app.get("/generate")
+async def generate(style: Literal["plain", "badge"] = Query("plain")):
+    """ZIP с PNG QR-кодов всех гостей; badge — с именем и кодом под QR."""
+    pages = guest_pages()
+    try:
+        # Первую страницу берём до ответа, чтобы ошибки users_service стали HTTP-ошибкой
+        first = await anext(pages, None)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"users_service недоступен: {str(e)}")
+    if first is None:
+        raise HTTPException(status_code=404, detail="Список гостей пуст")
+
+    filename = f"qr_{style}_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.zip"
+    return StreamingResponse(
+        GenerateRun(style).stream(pages, first),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host="0.0.0.0", port=8001)
@@ -0,0 +1,34 @@
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Optional
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+
+def _init_worker():
+    # Параллелизм даёт пул процессов, потоки OpenCV внутри только мешают
+    cv2.setNumThreads(1)
+
+
+class WorkerPool:
+    """Пул процессов для CPU-работы: распознавание и отрисовка QR-кодов."""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def start(self):
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+        logger.info(f"Worker pool started: {self.workers} processes")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    async def run(self, fn: Callable, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
@@ -0,0 +1,90 @@
+"""Смешанная нагрузка чтение/запись для профилей базы DB_PROFILE=default и production.
+
+Писатели шлют /mark, читатели — /export и /stats, всё параллельно
+в течение --seconds секунд. Для каждого профиля поднимается свой сервис
+со своей users.db.
+
+Запуск из services/users_service:
+    python benchmarks/bench_db_profile.py [--guests 5000] [--writers 16] [--readers 4] [--seconds 10]
+"""
+import argparse
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+import httpx
+
+from bench_mark import free_port, percentile, start_service
+
+
+def run_profile(profile: str, args) -> dict:
+    with tempfile.TemporaryDirectory() as workdir:
+        port = free_port()
+        url = f"http://127.0.0.1:{port}"
+        proc = start_service(workdir, port, {"DB_PROFILE": profile})
+        try:
+            with httpx.Client(base_url=url) as client:
+                for i in range(args.guests):
+                    client.post("/guests", json={"code": f"G{i}", "name": f"Гость {i}"})
+
+            stop_at = time.perf_counter() + args.seconds
+            lock = threading.Lock()
+            latencies = {"write": [], "read": []}
+            errors = {"write": 0, "read": 0}
+
+            def worker(kind: str):
+                with httpx.Client(base_url=url, timeout=30.0) as client:
+                    while time.perf_counter() < stop_at:
+                        start = time.perf_counter()
+                        if kind == "write":
+                            code = f"G{random.randrange(args.guests)}"
+                            resp = client.post("/mark", json={"code": code, "method": "qr"})
+                        else:
+                            resp = client.get(random.choice(["/export", "/stats"]))
+                        elapsed = (time.perf_counter() - start) * 1000
+                        with lock:
+                            if resp.status_code == 200:
+                                latencies[kind].append(elapsed)
+                            else:
+                                errors[kind] += 1
+
+            threads = [threading.Thread(target=worker, args=("write",)) for _ in range(args.writers)]
+            threads += [threading.Thread(target=worker, args=("read",)) for _ in range(args.readers)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        finally:
+            proc.terminate()
+            proc.wait()
+
+    result = {}
+    for kind in ("write", "read"):
+        values = latencies[kind] or [0.0]
+        result[kind] = (
+            f"{len(latencies[kind]) / args.seconds:7.1f} req/s  "
+            f"p50={statistics.median(values):7.1f}ms  p99={percentile(values, 99):7.1f}ms  "
+            f"errors={errors[kind]}"
+        )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--guests", type=int, default=5000)
+    parser.add_argument("--writers", type=int, default=16)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    for profile in ("default", "production"):
+        result = run_profile(profile, args)
+        print(f"[{profile}]")
+        print(f"  /mark          {result['write']}")
+        print(f"  /export,/stats {result['read']}")
+
+
+if __name__ == "__main__":
+    main()
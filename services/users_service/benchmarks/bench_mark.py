@@ -0,0 +1,110 @@
+"""Задержка /mark под параллельными сканированиями.
+
+Поднимает users_service через uvicorn во временной папке (своя users.db),
+добавляет гостей и шлёт /mark из нескольких потоков: половина кодов
+сканируется впервые, половина — повторно.
+
+Запуск из services/users_service:
+    python benchmarks/bench_mark.py [--guests 2000] [--scans 4000] [--threads 32]
+                                    [--env GROUP_COMMIT=1 ...]
+"""
+import argparse
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+SERVICE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+COMMON_DIR = os.path.abspath(os.path.join(SERVICE_DIR, "..", "..", "common"))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_service(workdir: str, port: int, env=None) -> subprocess.Popen:
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join([SERVICE_DIR, COMMON_DIR]), **(env or {})},
+    )
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            httpx.get(f"{url}/health", timeout=1.0)
+            return proc
+        except httpx.TransportError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("users_service did not start")
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--guests", type=int, default=2000)
+    parser.add_argument("--scans", type=int, default=4000)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--env", action="append", default=[], help="KEY=VALUE для сервиса")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        port = free_port()
+        url = f"http://127.0.0.1:{port}"
+        env = dict(item.split("=", 1) for item in args.env)
+        proc = start_service(workdir, port, env)
+        try:
+            with httpx.Client(base_url=url) as client:
+                for i in range(args.guests):
+                    client.post("/guests", json={"code": f"G{i}", "name": f"Гость {i}"})
+
+            codes = [f"G{random.randrange(args.guests)}" for _ in range(args.scans)]
+            local = threading.local()
+
+            def scan(code):
+                if not hasattr(local, "client"):
+                    local.client = httpx.Client(base_url=url, timeout=30.0)
+                start = time.perf_counter()
+                resp = local.client.post("/mark", json={"code": code, "method": "qr"})
+                elapsed = time.perf_counter() - start
+                return elapsed, resp.status_code
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.threads) as pool:
+                results = list(pool.map(scan, codes))
+            wall = time.perf_counter() - started
+
+            latencies = [t * 1000 for t, status in results if status == 200]
+            failed = sum(1 for _, status in results if status != 200)
+            marks = httpx.get(f"{url}/stats").json()
+            metrics = httpx.get(f"{url}/metrics").json()
+        finally:
+            proc.terminate()
+            proc.wait()
+
+    print(f"scans={args.scans} threads={args.threads} failed={failed} stats={marks}")
+    if "group_commit" in metrics:
+        print(f"group commit: {metrics['group_commit']}")
+    print(f"throughput: {args.scans / wall:.0f} scans/s")
+    print(
+        f"latency ms: p50={statistics.median(latencies):.1f} "
+        f"p90={percentile(latencies, 90):.1f} p99={percentile(latencies, 99):.1f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Сравнение старого цикла /search с ScoringEngine.
+
+full — снимок GuestIndex и оценка всего списка, как в rank_guests.
+Зависимости сверх сервиса: pip install -r benchmarks/requirements.txt
+
+Запуск из services/users_service:
+    python benchmarks/bench_search.py
+"""
+import os
+import random
+import sys
+import time
+
+import Levenshtein
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from scoring import ScoringEngine  # noqa: E402
+from search_index import GuestIndex, normalize  # noqa: E402
+
+SURNAMES = ["Иванов", "Петров", "Сидоров", "Кузнецов", "Смирнов", "Попов", "Волков", "Соколов"]
+FIRST_NAMES = ["Иван", "Пётр", "Анна", "Мария", "Олег", "Дмитрий", "Елена", "Сергей"]
+QUERIES = ["иванов иван", "смирнова", "пётр волков", "кузнецов дмитрий", "елена"]
+SIZES = [1_000, 10_000, 100_000]
+REPEATS = 5
+
+
+def make_roster(n: int):
+    rnd = random.Random(n)
+    return [
+        f"{rnd.choice(SURNAMES)}{rnd.choice(['', 'а'])} {rnd.choice(FIRST_NAMES)} {i}"
+        for i in range(n)
+    ]
+
+
+def legacy_loop(query: str, names):
+    scored = []
+    for name in names:
+        norm_name = " ".join(str(name).lower().split())
+        dist = Levenshtein.distance(query, norm_name)
+        max_len = max(len(query), len(norm_name)) or 1
+        scored.append((name, 1 - dist / max_len))
+    filtered = [(n, s) for n, s in scored if s >= 0.5]
+    filtered.sort(key=lambda x: x[1], reverse=True)
+    return filtered[:50]
+
+
+def timed(fn):
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        for q in QUERIES:
+            fn(q)
+        best = min(best, (time.perf_counter() - start) / len(QUERIES))
+    return best * 1000
+
+
+def full_search(engine: ScoringEngine, index: GuestIndex, query: str):
+    codes, names, norm_names = index.snapshot()
+    return [(codes[i], s) for i, s in engine.top_k(query, norm_names, 50, 0.5)]
+
+
+def main():
+    engine = ScoringEngine(pool_threshold=1, workers=max(2, os.cpu_count() or 1))
+    engine.start()
+    service = ScoringEngine(pool_threshold=0)
+    columns = ["legacy", "batch", "pool", "full"]
+    print(
+        f"{'guests':>8} " + " ".join(f"{c + ' ms':>12}" for c in columns)
+        + f"  (workers={engine.workers}, cpus={os.cpu_count()})"
+    )
+    for n in SIZES:
+        names = make_roster(n)
+        norm_names = [normalize(name) for name in names]
+        index = GuestIndex()
+        index.rebuild((f"G{i:06d}", name) for i, name in enumerate(names))
+
+        results = [timed(lambda q: legacy_loop(q, names))]
+        engine.pool_threshold = n + 1
+        results.append(timed(lambda q: engine.top_k(q, norm_names, 50, 0.5)))
+        engine.pool_threshold = 1
+        results.append(timed(lambda q: engine.top_k(q, norm_names, 50, 0.5)))
+
+        # Дальше — как в сервисе с настройками по умолчанию: без пула
+        results.append(timed(lambda q: full_search(service, index, normalize(q))))
+
+        print(f"{n:>8} " + " ".join(f"{r:>12.2f}" for r in results))
+    engine.shutdown()
+    service.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import os
+
+# База данных
+# SQLite-файл по умолчанию или PostgreSQL, например
+# postgresql+psycopg://qr:qr@postgres:5432/qr
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./users.db")
+# default — как раньше; production — WAL и настроенные PRAGMA для SQLite, пул соединений
+DB_PROFILE = os.getenv("DB_PROFILE", "default")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+# Через сколько секунд пересоздавать соединение с PostgreSQL
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", str(64 * 1024)))
+
+# Поиск гостей
+SEARCH_LIMIT = int(os.getenv("SEARCH_LIMIT", "50"))
+SEARCH_THRESHOLD = float(os.getenv("SEARCH_THRESHOLD", "0.5"))
+# С какого размера пакета оценка делится между процессами (0 — без пула).
+# По умолчанию выключено: на одном ядре пул в разы медленнее (bench_search.py),
+# включать после замера на своей машине
+SEARCH_POOL_THRESHOLD = int(os.getenv("SEARCH_POOL_THRESHOLD", "0"))
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", "0")) or None
+# Размер LRU-кэша результатов /search (0 — без кэша)
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "1024"))
+
+# Импорт списков гостей
+# Сколько строк файла читается и коммитится за один раз
+IMPORT_CHUNK_ROWS = int(os.getenv("IMPORT_CHUNK_ROWS", "2000"))
+# Задача в очереди или в работе, чей процесс не отмечался столько секунд,
+# считается брошенной (процесс упал) и помечается failed
+IMPORT_STALE_SECONDS = float(os.getenv("IMPORT_STALE_SECONDS", "60"))
+
+# Отметки
+# Максимум отметок в одном запросе POST /mark/batch
+MARK_BATCH_MAX = int(os.getenv("MARK_BATCH_MAX", "1000"))
+# Групповой коммит /mark: копим отметки до окна или размера пакета
+GROUP_COMMIT = os.getenv("GROUP_COMMIT", "0") == "1"
+GROUP_COMMIT_WINDOW_MS = float(os.getenv("GROUP_COMMIT_WINDOW_MS", "5"))
+GROUP_COMMIT_MAX_BATCH = int(os.getenv("GROUP_COMMIT_MAX_BATCH", "100"))
+# Ключ подписи кодов в QR (пусто — коды без подписи). Один и тот же для
+# users_service, qr_service и бота
+CODE_SIGNING_KEY = os.getenv("CODE_SIGNING_KEY", "")
+# Принимать коды без подписи — старые списки и напечатанные до включения подписи QR
+ACCEPT_PLAIN_CODES = os.getenv("ACCEPT_PLAIN_CODES", "1") == "1"
+
+# Запуск
+WORKERS = int(os.getenv("WORKERS", "1"))
+# Сверять индекс и кэш поиска с версией списка гостей в базе перед каждым
+# поиском. Нужно, когда в базу пишут несколько процессов.
+COHERENT_CACHES = os.getenv("COHERENT_CACHES", "1" if WORKERS > 1 else "0") == "1"
+
+# Поток событий /events/stream
+# Сколько событий может ждать один клиент, прежде чем его отключат
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "100"))
+EVENTS_STATS_INTERVAL = float(os.getenv("EVENTS_STATS_INTERVAL", "5"))
+EVENTS_KEEPALIVE = float(os.getenv("EVENTS_KEEPALIVE", "15"))
+
+# Постраничный список гостей
+GUESTS_PAGE_MAX = int(os.getenv("GUESTS_PAGE_MAX", "500"))
+
+# Журнал изменений GET /changes
+CHANGES_PAGE_MAX = int(os.getenv("CHANGES_PAGE_MAX", "5000"))
@@ -0,0 +1,190 @@
+import collections
+from datetime import datetime
+from typing import Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import DateTime, String, delete, func, insert, literal, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from models import Change, Counter, Guest, Mark
+
+
+def dialect_insert(db: Session, model):
+    """INSERT с поддержкой ON CONFLICT для текущего диалекта базы."""
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+
+STAT_GUESTS = "total_guests"
+STAT_SCANNED = "total_scanned"
+# Счётчики первых отметок по способу: method:qr, method:manual, ...
+METHOD_PREFIX = "method:"
+KNOWN_METHODS = ("qr", "manual", "search")
+
+
+def counter_stmt(name: str):
+    return select(Counter.value).where(Counter.name == name)
+
+
+def bump_counter_stmt(db: Session, name: str, delta: int = 1):
+    """Увеличивает счётчик (создавая его) в текущей транзакции и возвращает новое значение."""
+    return (
+        dialect_insert(db, Counter)
+        .values(name=name, value=delta)
+        .on_conflict_do_update(index_elements=[Counter.name], set_={"value": Counter.value + delta})
+        .returning(Counter.value)
+    )
+
+
+def new_marks_stmts(db: Session, methods: Iterable[str]) -> list:
+    """Запросы, учитывающие первые отметки гостей в счётчиках статистики.
+
+    Выполняются в транзакции самих отметок, коммит — на вызывающем.
+    """
+    by_method = collections.Counter(methods)
+    if not by_method:
+        return []
+    stmts = [bump_counter_stmt(db, STAT_SCANNED, sum(by_method.values()))]
+    for method, count in sorted(by_method.items()):
+        stmts.append(bump_counter_stmt(db, METHOD_PREFIX + method, count))
+    return stmts
+
+
+def rebuild_stats(db: Session):
+    """Пересчитывает счётчики статистики по таблицам. Коммит — на вызывающем.
+
+    Значения пишутся через upsert, а удаляются только счётчики исчезнувших
+    способов отметки: несколько воркеров, стартующих одновременно, не
+    упираются в первичный ключ counters.
+    """
+    values = [
+        {"name": STAT_GUESTS, "value": db.execute(select(func.count()).select_from(Guest)).scalar_one()},
+        {"name": STAT_SCANNED, "value": db.execute(select(func.count()).select_from(Mark)).scalar_one()},
+    ]
+    for method, count in db.execute(select(Mark.method, func.count()).group_by(Mark.method)):
+        values.append({"name": METHOD_PREFIX + (method or ""), "value": count})
+
+    db.execute(
+        delete(Counter).where(
+            Counter.name.startswith(METHOD_PREFIX),
+            Counter.name.not_in([v["name"] for v in values]),
+        )
+    )
+    stmt = dialect_insert(db, Counter)
+    db.execute(
+        stmt.on_conflict_do_update(index_elements=[Counter.name], set_={"value": stmt.excluded.value}),
+        values,
+    )
+
+
+CHANGES_SEQ = "changes_seq"
+CHANGES_EPOCH = "changes_epoch"
+CHANGE_GUEST_ADD = "guest_add"
+CHANGE_MARK = "mark"
+CHANGE_CLEAR = "clear"
+
+
+def change_item(
+    code: Optional[str] = None,
+    name: Optional[str] = None,
+    method: Optional[str] = None,
+    timestamp: Optional[datetime] = None,
+) -> dict:
+    return {"code": code, "name": name, "method": method, "timestamp": timestamp}
+
+
+def mark_change(mark) -> dict:
+    """Элемент журнала для первой отметки — строки из mark_upsert_stmt."""
+    return change_item(mark.code, mark.name, mark.method, mark.timestamp)
+
+
+def change_rows(last_seq: int, kind: str, items: List[dict]) -> List[dict]:
+    """Строки журнала с номерами, заканчивающимися на last_seq."""
+    first = last_seq - len(items) + 1
+    return [{"seq": first + i, "kind": kind, **item} for i, item in enumerate(items)]
+
+
+def record_changes(db: Session, kind: str, items: List[dict]):
+    """Пишет изменения в журнал в текущей транзакции, коммит — на вызывающем.
+
+    Вызывать последним перед коммитом: строка счётчика changes_seq остаётся
+    заблокированной до конца транзакции.
+    """
+    if not items:
+        return
+    last_seq = db.execute(bump_counter_stmt(db, CHANGES_SEQ, len(items))).scalar_one()
+    db.execute(insert(Change), change_rows(last_seq, kind, items))
+
+
+def stats_stmt():
+    """Все счётчики статистики — несколько строк по первичному ключу, без подсчёта таблиц."""
+    return select(Counter.name, Counter.value).where(
+        or_(Counter.name.in_([STAT_GUESTS, STAT_SCANNED]), Counter.name.startswith(METHOD_PREFIX))
+    )
+
+
+def stats_dict(rows) -> dict:
+    values = dict(rows)
+    by_method = {method: 0 for method in KNOWN_METHODS}
+    for name, value in values.items():
+        if name.startswith(METHOD_PREFIX):
+            by_method[name[len(METHOD_PREFIX):]] = value
+    return {
+        "total_guests": values.get(STAT_GUESTS, 0),
+        "total_scanned": values.get(STAT_SCANNED, 0),
+        "by_method": by_method,
+    }
+
+
+def existing_guest_codes(db: Session) -> Set[str]:
+    return set(db.execute(select(Guest.code)).scalars())
+
+
+def insert_guests(
+    db: Session,
+    guests: Iterable[dict],
+    batch_size: int = 1000,
+) -> List[Tuple[str, str]]:
+    """Пакетная вставка гостей, уже существующие коды пропускаются.
+
+    Возвращает (code, name) реально добавленных гостей. Коммит — на вызывающем.
+    """
+    stmt = (
+        dialect_insert(db, Guest)
+        .on_conflict_do_nothing(index_elements=[Guest.code])
+        .returning(Guest.code, Guest.name)
+    )
+
+    inserted: List[Tuple[str, str]] = []
+    batch: List[dict] = []
+    for guest in guests:
+        batch.append(guest)
+        if len(batch) >= batch_size:
+            inserted.extend(db.execute(stmt, batch).all())
+            batch = []
+    if batch:
+        inserted.extend(db.execute(stmt, batch).all())
+    return [(code, name) for code, name in inserted]
+
+
+def mark_upsert_stmt(db: Session, code: str, method: str, timestamp: datetime):
+    """Отметка гостя одним запросом INSERT ... SELECT ... ON CONFLICT ... RETURNING.
+
+    Гость ищется в том же запросе: если кода нет в guests, строк не вернётся.
+    Повторное сканирование не меняет первую отметку, а только увеличивает
+    scans, поэтому already_marked = scans > 1.
+    """
+    source = select(
+        Guest.code,
+        Guest.name,
+        literal(method, String()),
+        literal(timestamp, DateTime(timezone=True)),
+    ).where(Guest.code == code)
+
+    return (
+        dialect_insert(db, Mark)
+        .from_select(["code", "name", "method", "timestamp"], source)
+        .on_conflict_do_update(index_elements=[Mark.code], set_={"scans": Mark.scans + 1})
+        .returning(Mark.code, Mark.name, Mark.method, Mark.timestamp, Mark.scans)
+    )
@@ -1,16 +1,149 @@
-from sqlalchemy import create_engine
+import secrets
+
+from sqlalchemy import create_engine, event, inspect, make_url, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
+from sqlalchemy.pool import QueuePool
+
+import config
 
-DATABASE_URL = "sqlite:///./users.db"  # файл users.db в папке /app (в контейнере)
+# По умолчанию файл users.db в папке /app (в контейнере)
+DATABASE_URL = make_url(config.DATABASE_URL)
+IS_SQLITE = DATABASE_URL.get_backend_name() == "sqlite"
+
+if IS_SQLITE:
+    # Тот же файл через aiosqlite — для асинхронных эндпоинтов
+    ASYNC_DATABASE_URL = DATABASE_URL.set(drivername="sqlite+aiosqlite")
+else:
+    # psycopg 3 умеет и синхронный, и асинхронный режим
+    DATABASE_URL = DATABASE_URL.set(drivername="postgresql+psycopg")
+    ASYNC_DATABASE_URL = DATABASE_URL
 
 
 class Base(DeclarativeBase):
     pass
 
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False},
-)
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # WAL: читатели (/export, /search) не блокируют писателей (/mark) и наоборот
+    cursor.execute("PRAGMA journal_mode=WAL")
+    # В режиме WAL NORMAL не теряет целостность, fsync только на checkpoint
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={config.SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA mmap_size={config.SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA cache_size=-{config.SQLITE_CACHE_SIZE_KB}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+if not IS_SQLITE:
+    pool_options = {
+        "pool_size": config.DB_POOL_SIZE,
+        "max_overflow": config.DB_MAX_OVERFLOW,
+        "pool_recycle": config.DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+    engine = create_engine(DATABASE_URL, **pool_options)
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, **pool_options)
+elif config.DB_PROFILE == "production":
+    engine = create_engine(
+        DATABASE_URL,
+        connect_args={
+            "check_same_thread": False,
+            "timeout": config.SQLITE_BUSY_TIMEOUT_MS / 1000,
+        },
+        poolclass=QueuePool,
+        pool_size=config.DB_POOL_SIZE,
+        max_overflow=config.DB_MAX_OVERFLOW,
+    )
+    event.listen(engine, "connect", set_sqlite_pragmas)
+
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        connect_args={"timeout": config.SQLITE_BUSY_TIMEOUT_MS / 1000},
+        pool_size=config.DB_POOL_SIZE,
+        max_overflow=config.DB_MAX_OVERFLOW,
+    )
+    event.listen(async_engine.sync_engine, "connect", set_sqlite_pragmas)
+else:
+    engine = create_engine(
+        DATABASE_URL,
+        connect_args={"check_same_thread": False},
+    )
+    async_engine = create_async_engine(ASYNC_DATABASE_URL)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+def ensure_schema():
+    """create_all плюс доводка таблиц, созданных старыми версиями сервиса."""
+    with engine.begin() as conn:
+        if not IS_SQLITE:
+            # Несколько воркеров стартуют одновременно — схему доводит один
+            conn.execute(text("SELECT pg_advisory_xact_lock(7270001)"))
+
+        Base.metadata.create_all(bind=conn)
+        # create_all не добавляет новые индексы в уже существующие таблицы
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+        insp = inspect(conn)
+
+        if "scans" not in {c["name"] for c in insp.get_columns("marks")}:
+            conn.execute(text("ALTER TABLE marks ADD COLUMN scans INTEGER NOT NULL DEFAULT 1"))
+
+        job_columns = {c["name"] for c in insp.get_columns("import_jobs")}
+        for column, ddl in (("upload_path", "VARCHAR"), ("owner", "VARCHAR"), ("heartbeat_at", "TIMESTAMP")):
+            if column not in job_columns:
+                conn.execute(text(f"ALTER TABLE import_jobs ADD COLUMN {column} {ddl}"))
+
+        # Раньше marks.code не был уникальным: оставляем первую отметку по коду
+        unique_code = any(
+            idx["unique"] and idx["column_names"] == ["code"]
+            for idx in insp.get_indexes("marks")
+        )
+        if not unique_code:
+            conn.execute(text(
+                "DELETE FROM marks WHERE id NOT IN (SELECT MIN(id) FROM marks GROUP BY code)"
+            ))
+            conn.execute(text("DROP INDEX IF EXISTS ix_marks_code"))
+            conn.execute(text("CREATE UNIQUE INDEX ix_marks_code ON marks (code)"))
+
+        conn.execute(text(
+            "INSERT INTO counters (name, value) SELECT 'roster_version', 0 "
+            "WHERE NOT EXISTS (SELECT 1 FROM counters WHERE name = 'roster_version')"
+        ))
+
+        # Журнал изменений появился позже гостей и отметок: заполняем его
+        # текущим состоянием, иначе реплики не увидят уже существующих гостей
+        has_changes_seq = conn.execute(text(
+            "SELECT 1 FROM counters WHERE name = 'changes_seq'"
+        )).first()
+        if not has_changes_seq:
+            conn.execute(text("DELETE FROM changes"))
+            conn.execute(text(
+                "INSERT INTO changes (seq, kind, code, name) "
+                "SELECT ROW_NUMBER() OVER (ORDER BY id), 'guest_add', code, name FROM guests"
+            ))
+            conn.execute(text(
+                "INSERT INTO changes (seq, kind, code, name, method, timestamp) "
+                "SELECT (SELECT COUNT(*) FROM guests) + ROW_NUMBER() OVER (ORDER BY id), "
+                "'mark', code, name, method, timestamp FROM marks"
+            ))
+            conn.execute(text(
+                "INSERT INTO counters (name, value) SELECT 'changes_seq', COUNT(*) FROM changes"
+            ))
+            conn.execute(text("DELETE FROM counters WHERE name = 'changes_epoch'"))
+
+        # Эпоха журнала — случайное число, новое при каждом заполнении журнала
+        # с нуля. По её смене реплика видит, что базу пересоздали, даже если
+        # новые номера уже обогнали её seq
+        conn.execute(
+            text(
+                "INSERT INTO counters (name, value) SELECT 'changes_epoch', :epoch "
+                "WHERE NOT EXISTS (SELECT 1 FROM counters WHERE name = 'changes_epoch')"
+            ),
+            {"epoch": secrets.randbits(62)},
+        )
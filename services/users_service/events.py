@@ -0,0 +1,121 @@
+import asyncio
+import json
+import logging
+from typing import AsyncIterator, Awaitable, Callable, Optional, Set
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Очередь отключённого медленного клиента получает этот маркер
+_DROPPED = None
+
+
+def sse_message(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class EventBroker:
+    """Рассылка событий подписчикам /events/stream.
+
+    Событие форматируется один раз и раскладывается по очередям клиентов.
+    Очереди ограничены: клиент, который не успевает читать, отключается,
+    а не копит память и не тормозит остальных.
+    """
+
+    def __init__(self, queue_size: int, stats_interval: float, keepalive: float):
+        self.queue_size = queue_size
+        self.stats_interval = stats_interval
+        self.keepalive = keepalive
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stats_task: Optional[asyncio.Task] = None
+        self.published = 0
+        self.dropped = 0
+
+    def start(self, snapshot: Callable[[], Awaitable[dict]]):
+        self._loop = asyncio.get_running_loop()
+        self._stats_task = asyncio.create_task(self._stats_loop(snapshot))
+
+    async def stop(self):
+        if self._stats_task is not None:
+            self._stats_task.cancel()
+            try:
+                await self._stats_task
+            except asyncio.CancelledError:
+                pass
+            self._stats_task = None
+        for queue in list(self._subscribers):
+            self._drop(queue)
+
+    def publish(self, event: str, data: dict):
+        """Вызывается из event loop."""
+        if not self._subscribers:
+            return
+        message = sse_message(event, data)
+        self.published += 1
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                logger.warning("Dropping slow event stream subscriber")
+                self.dropped += 1
+                self._drop(queue)
+
+    def publish_threadsafe(self, event: str, data: dict):
+        """Для синхронных эндпоинтов, которые FastAPI выполняет в пуле потоков."""
+        if self._loop is not None and self._subscribers:
+            self._loop.call_soon_threadsafe(self.publish, event, data)
+
+    def _drop(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(_DROPPED)
+
+    async def stream(self, first: Optional[str] = None) -> AsyncIterator[str]:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        logger.info(f"Event stream subscriber connected ({len(self._subscribers)} total)")
+        try:
+            if first is not None:
+                yield first
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=self.keepalive)
+                except asyncio.TimeoutError:
+                    # Комментарий SSE, чтобы прокси не рвали простаивающее соединение
+                    yield ": keepalive\n\n"
+                    continue
+                if message is _DROPPED:
+                    yield sse_message("dropped", {"reason": "slow consumer"})
+                    return
+                yield message
+        finally:
+            self._subscribers.discard(queue)
+            logger.info(f"Event stream subscriber disconnected ({len(self._subscribers)} left)")
+
+    async def _stats_loop(self, snapshot: Callable[[], Awaitable[dict]]):
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            # Один снимок на всех подписчиков и ни одного, если их нет
+            if not self._subscribers:
+                continue
+            try:
+                self.publish("stats", await snapshot())
+            except Exception as e:
+                logger.error(f"Stats snapshot for event stream failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "published": self.published,
+            "dropped": self.dropped,
+        }
+
+
+event_broker = EventBroker(
+    config.EVENTS_QUEUE_SIZE,
+    config.EVENTS_STATS_INTERVAL,
+    config.EVENTS_KEEPALIVE,
+)
@@ -0,0 +1,129 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import config
+from crud import CHANGE_MARK, mark_change, mark_upsert_stmt, new_marks_stmts, record_changes
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+class MarkBatcher:
+    """Групповой коммит отметок.
+
+    Запросы /mark копятся до window_ms миллисекунд (или до max_batch штук)
+    и записываются одной транзакцией. Каждый вызывающий получает свою строку
+    из RETURNING (или None, если кода нет) через Future.
+    """
+
+    def __init__(self, window_ms: float, max_batch: int):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._queue: "queue.Queue[Optional[Tuple[str, str, datetime, Future]]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.marks = 0
+        self.max_batch_size = 0
+        self.flush_ms_total = 0.0
+        self.flush_ms_max = 0.0
+        self.flush_ms_last = 0.0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="mark-batcher", daemon=True)
+        self._thread.start()
+        logger.info(f"Group commit enabled: window={self.window * 1000:.1f}ms max_batch={self.max_batch}")
+
+    def stop(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, code: str, method: str, timestamp: datetime) -> Future:
+        future: Future = Future()
+        self._queue.put((code, method, timestamp, future))
+        return future
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+
+            batch = [first]
+            deadline = time.monotonic() + self.window
+            stop = False
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            self._flush(batch)
+            if stop:
+                return
+
+    def _flush(self, batch: List[Tuple[str, str, datetime, Future]]):
+        started = time.perf_counter()
+        db = SessionLocal()
+        try:
+            rows = [
+                db.execute(mark_upsert_stmt(db, code, method, timestamp)).first()
+                for code, method, timestamp, _ in batch
+            ]
+            new_marks = [r for r in rows if r is not None and r.scans == 1]
+            for stmt in new_marks_stmts(db, [r.method for r in new_marks]):
+                db.execute(stmt)
+            record_changes(db, CHANGE_MARK, [mark_change(r) for r in new_marks])
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Group commit of {len(batch)} marks failed: {e}")
+            for *_, future in batch:
+                future.set_exception(e)
+            return
+        finally:
+            db.close()
+
+        for (*_, future), row in zip(batch, rows):
+            future.set_result(row)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._stats_lock:
+            self.batches += 1
+            self.marks += len(batch)
+            self.max_batch_size = max(self.max_batch_size, len(batch))
+            self.flush_ms_total += elapsed_ms
+            self.flush_ms_max = max(self.flush_ms_max, elapsed_ms)
+            self.flush_ms_last = elapsed_ms
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            batches = self.batches or 1
+            return {
+                "window_ms": self.window * 1000,
+                "max_batch": self.max_batch,
+                "batches": self.batches,
+                "marks": self.marks,
+                "avg_batch_size": round(self.marks / batches, 2),
+                "max_batch_size": self.max_batch_size,
+                "avg_flush_ms": round(self.flush_ms_total / batches, 2),
+                "max_flush_ms": round(self.flush_ms_max, 2),
+                "last_flush_ms": round(self.flush_ms_last, 2),
+            }
+
+
+mark_batcher = MarkBatcher(config.GROUP_COMMIT_WINDOW_MS, config.GROUP_COMMIT_MAX_BATCH)
@@ -0,0 +1,282 @@
+import json
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import BinaryIO, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import Session
+
+import config
+from crud import existing_guest_codes
+from database import SessionLocal
+from importer import detect_columns, import_chunk, read_batches
+from models import ImportJobRecord
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class ImportJob:
+    def __init__(self, filename: str, upload_path: Optional[str] = None, owner: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.upload_path = upload_path
+        self.owner = owner
+        self.status = "queued"  # queued / running / done / failed
+        self.total_rows: Optional[int] = None
+        self.rows_processed = 0
+        self.added_guests = 0
+        self.errors: List[str] = []
+        self.error: Optional[str] = None
+        self.created_at = datetime.now()
+        self.finished_at: Optional[datetime] = None
+
+    def to_record(self) -> ImportJobRecord:
+        return ImportJobRecord(
+            id=self.id,
+            filename=self.filename,
+            status=self.status,
+            total_rows=self.total_rows,
+            rows_processed=self.rows_processed,
+            added_guests=self.added_guests,
+            errors_count=len(self.errors),
+            errors=json.dumps(self.errors[:10], ensure_ascii=False),
+            error=self.error,
+            created_at=self.created_at,
+            finished_at=self.finished_at,
+            upload_path=self.upload_path,
+            owner=self.owner,
+            heartbeat_at=datetime.now(),
+        )
+
+
+def failure_text(job: ImportJob, error: Exception) -> str:
+    """Текст ошибки импорта; части файла до ошибки уже закоммичены — сколько именно."""
+    text = str(error)
+    if job.rows_processed:
+        text += (
+            f". Первые {job.rows_processed} строк файла уже сохранены, "
+            f"добавлено гостей: {job.added_guests}"
+        )
+    return text
+
+
+def remove_upload(path: Optional[str]):
+    if path:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+def job_dict(record: ImportJobRecord) -> dict:
+    return {
+        "job_id": record.id,
+        "filename": record.filename,
+        "status": record.status,
+        "total_rows": record.total_rows,
+        "rows_processed": record.rows_processed,
+        "added_guests": record.added_guests,
+        "errors_count": record.errors_count,
+        "errors": json.loads(record.errors),
+        "error": record.error,
+        "created_at": record.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+        "finished_at": record.finished_at.strftime("%Y-%m-%d %H:%M:%S") if record.finished_at else None,
+    }
+
+
+def run_import(
+    db: Session,
+    job: ImportJob,
+    fileobj: BinaryIO,
+    batch_rows: int,
+    on_progress: Optional[Callable[[ImportJob], None]] = None,
+):
+    """Потоковый импорт: файл читается и коммитится пакетами по batch_rows строк.
+
+    Ошибки чтения файла и колонок — ValueError, ошибки базы пробрасываются.
+    on_progress вызывается после каждого пакета.
+    """
+    job.status = "running"
+    header, job.total_rows, batches = read_batches(fileobj, job.filename, batch_rows)
+    code_col, name_col = detect_columns(header)
+    existing = existing_guest_codes(db)
+
+    for batch in batches:
+        added, row_errors = import_chunk(db, batch, code_col, name_col, existing)
+        job.added_guests += added
+        job.errors.extend(text for _, text in row_errors)
+        job.rows_processed += len(batch)
+        if on_progress is not None:
+            on_progress(job)
+
+    job.total_rows = job.rows_processed
+    job.status = "done"
+    job.finished_at = datetime.now()
+
+
+class ImportJobs:
+    """Фоновые импорты: по одному за раз, с коммитом после каждой части файла.
+
+    Состояние задач пишется в таблицу import_jobs, поэтому статус можно
+    спросить у любого воркера, а не только у того, что принял файл.
+
+    Пока задача в очереди или в работе, процесс-владелец раз в
+    IMPORT_STALE_SECONDS / 4 обновляет heartbeat_at. Задачу, которая
+    не обновлялась дольше IMPORT_STALE_SECONDS, процесс бросил (упал или
+    был убит): её помечает failed и удаляет её файл любой воркер — при
+    старте или когда о ней спрашивают.
+    """
+
+    def __init__(self, chunk_rows: int, max_jobs: int = 100, stale_seconds: float = 60):
+        self.chunk_rows = chunk_rows
+        self.max_jobs = max_jobs
+        self.stale_seconds = stale_seconds
+        self.owner = uuid.uuid4().hex
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="import")
+        self._pending: Dict[str, Tuple[Future, ImportJob]] = {}
+        self._stopping = threading.Event()
+        self._heartbeat: Optional[threading.Thread] = None
+
+    def start(self):
+        failed = self.fail_abandoned()
+        if failed:
+            logger.warning(f"Marked {failed} abandoned import jobs as failed")
+        self._heartbeat = threading.Thread(target=self._beat, name="import-heartbeat", daemon=True)
+        self._heartbeat.start()
+
+    def submit(self, filename: str, path: str) -> ImportJob:
+        job = ImportJob(filename, path, self.owner)
+        self._save(job)
+        self._prune()
+        future = self._executor.submit(self._run, job)
+        self._pending[job.id] = (future, job)
+        future.add_done_callback(lambda _: self._pending.pop(job.id, None))
+        logger.info(f"Import job {job.id} queued for {filename}")
+        return job
+
+    def get(self, job_id: str) -> Optional[dict]:
+        db = SessionLocal()
+        try:
+            record = db.get(ImportJobRecord, job_id)
+            if record is None:
+                return None
+            if record.status in ACTIVE_STATUSES and self._is_stale(record):
+                self._fail(db, [record])
+            return job_dict(record)
+        finally:
+            db.close()
+
+    def fail_abandoned(self) -> int:
+        """Помечает failed все брошенные задачи и удаляет их файлы."""
+        db = SessionLocal()
+        try:
+            records = db.execute(
+                select(ImportJobRecord).where(ImportJobRecord.status.in_(ACTIVE_STATUSES))
+            ).scalars().all()
+            stale = [r for r in records if self._is_stale(r)]
+            self._fail(db, stale)
+            return len(stale)
+        finally:
+            db.close()
+
+    def _is_stale(self, record: ImportJobRecord) -> bool:
+        if record.heartbeat_at is None:
+            return True
+        return record.heartbeat_at < datetime.now() - timedelta(seconds=self.stale_seconds)
+
+    def _fail(self, db: Session, records: List[ImportJobRecord]):
+        if not records:
+            return
+        now = datetime.now()
+        for record in records:
+            remove_upload(record.upload_path)
+            record.status = "failed"
+            record.error = "Импорт прерван: процесс сервиса был остановлен"
+            record.finished_at = now
+            logger.warning(f"Import job {record.id} abandoned by its process, marked failed")
+        db.commit()
+
+    def _beat(self):
+        while not self._stopping.wait(self.stale_seconds / 4):
+            db = SessionLocal()
+            try:
+                db.execute(
+                    update(ImportJobRecord)
+                    .where(
+                        ImportJobRecord.owner == self.owner,
+                        ImportJobRecord.status.in_(ACTIVE_STATUSES),
+                    )
+                    .values(heartbeat_at=datetime.now())
+                )
+                db.commit()
+            except Exception as e:
+                logger.warning(f"Import jobs heartbeat failed: {e}")
+            finally:
+                db.close()
+
+    def _save(self, job: ImportJob):
+        db = SessionLocal()
+        try:
+            db.merge(job.to_record())
+            db.commit()
+        finally:
+            db.close()
+
+    def _prune(self):
+        db = SessionLocal()
+        try:
+            keep = (
+                select(ImportJobRecord.id)
+                .order_by(ImportJobRecord.created_at.desc())
+                .limit(self.max_jobs)
+                .scalar_subquery()
+            )
+            db.execute(delete(ImportJobRecord).where(ImportJobRecord.id.not_in(keep)))
+            db.commit()
+        finally:
+            db.close()
+
+    def _run(self, job: ImportJob):
+        db = SessionLocal()
+        try:
+            with open(job.upload_path, "rb") as f:
+                run_import(db, job, f, self.chunk_rows, on_progress=self._save)
+            logger.info(
+                f"Import job {job.id} done: {job.added_guests} added, {len(job.errors)} errors"
+            )
+        except Exception as e:
+            job.status = "failed"
+            job.error = failure_text(job, e)
+            job.finished_at = datetime.now()
+            logger.error(f"Import job {job.id} failed: {e}")
+        finally:
+            db.close()
+            remove_upload(job.upload_path)
+            self._save(job)
+
+    def shutdown(self):
+        """Текущий импорт доработает, задачи из очереди отменяются."""
+        self._stopping.set()
+        # Отменённые futures сразу убирают себя из _pending — список берём заранее
+        pending = list(self._pending.values())
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        for future, job in pending:
+            if not future.cancelled():
+                continue
+            job.status = "failed"
+            job.error = "Импорт отменён: сервис остановлен"
+            job.finished_at = datetime.now()
+            remove_upload(job.upload_path)
+            try:
+                self._save(job)
+            except Exception as e:
+                logger.error(f"Failed to save cancelled import job {job.id}: {e}")
+
+
+import_jobs = ImportJobs(config.IMPORT_CHUNK_ROWS, stale_seconds=config.IMPORT_STALE_SECONDS)
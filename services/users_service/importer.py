@@ -0,0 +1,235 @@
+import codecs
+import csv
+import io
+import logging
+from datetime import datetime
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Set, Tuple
+
+import openpyxl
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from crud import (
+    CHANGE_GUEST_ADD,
+    STAT_GUESTS,
+    bump_counter_stmt,
+    change_item,
+    insert_guests,
+    record_changes,
+)
+from roster_sync import roster_sync
+from search_index import guest_index
+
+logger = logging.getLogger(__name__)
+
+POSSIBLE_CODE_NAMES = ["код"]
+POSSIBLE_NAME_NAMES = ["фио"]
+
+SUPPORTED_EXTENSIONS = (".xlsx", ".xls", ".csv")
+
+
+def _xlsx_rows(fileobj: BinaryIO) -> Tuple[Optional[int], Iterator[tuple]]:
+    # read_only: openpyxl читает лист потоково, не держа его целиком в памяти
+    wb = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+    ws = wb.worksheets[0]
+    total = ws.max_row - 1 if ws.max_row else None
+
+    def rows():
+        try:
+            yield from ws.iter_rows(values_only=True)
+        finally:
+            wb.close()
+
+    return total, rows()
+
+
+def _csv_encoding(fileobj: BinaryIO) -> str:
+    """utf-8-sig, если весь файл — корректный UTF-8, иначе cp1251.
+
+    CSV из Excel с русской локалью сохраняется в cp1251. Файл проверяется
+    целиком до импорта: ошибка декодирования посреди файла оставила бы
+    список гостей наполовину загруженным.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        while True:
+            chunk = fileobj.read(1 << 20)
+            decoder.decode(chunk, final=not chunk)
+            if not chunk:
+                return "utf-8-sig"
+    except UnicodeDecodeError:
+        return "cp1251"
+    finally:
+        fileobj.seek(0)
+
+
+def _csv_rows(fileobj: BinaryIO) -> Tuple[Optional[int], Iterator[tuple]]:
+    encoding = _csv_encoding(fileobj)
+    logger.info(f"CSV encoding: {encoding}")
+    text = io.TextIOWrapper(fileobj, encoding=encoding, newline="")
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    return None, (tuple(row) for row in csv.reader(text, dialect))
+
+
+def _xls_rows(fileobj: BinaryIO) -> Tuple[Optional[int], Iterator[tuple]]:
+    # Старый формат .xls openpyxl не читает — остаётся pandas (весь лист)
+    df = pd.read_excel(fileobj, header=None, dtype=object)
+    return len(df) - 1, df.itertuples(index=False, name=None)
+
+
+def read_batches(
+    fileobj: BinaryIO,
+    filename: str,
+    batch_rows: int,
+) -> Tuple[list, Optional[int], Iterator[pd.DataFrame]]:
+    """Заголовок, примерное число строк и ленивый поток пакетов по batch_rows строк.
+
+    Индекс DataFrame — номер строки данных с нуля, как у pd.read_excel.
+    """
+    filename = filename.lower()
+    try:
+        if filename.endswith(".xlsx"):
+            total, rows = _xlsx_rows(fileobj)
+        elif filename.endswith(".csv"):
+            total, rows = _csv_rows(fileobj)
+        else:
+            total, rows = _xls_rows(fileobj)
+        header = next(rows, None)
+    except Exception as e:
+        raise ValueError(f"Не удалось прочитать файл: {str(e)}")
+
+    if header is None:
+        raise ValueError("Файл пуст")
+
+    header = [
+        str(col).strip() if col is not None else f"Unnamed: {i}"
+        for i, col in enumerate(header)
+    ]
+    logger.info(f"Roster file opened. Columns: {header}")
+    return header, total, _batches(header, rows, batch_rows)
+
+
+def _batches(header: list, rows: Iterable[tuple], batch_rows: int) -> Iterator[pd.DataFrame]:
+    width = len(header)
+    batch: List[tuple] = []
+    index: List[int] = []
+
+    for i, row in enumerate(rows):
+        # Пустые строки пропускаем, как это делает pandas
+        if not any(v is not None and str(v).strip() for v in row):
+            continue
+        row = tuple(row[:width]) + (None,) * (width - len(row))
+        batch.append(row)
+        index.append(i)
+        if len(batch) >= batch_rows:
+            yield pd.DataFrame(batch, columns=header, index=index, dtype=object)
+            batch, index = [], []
+
+    if batch:
+        yield pd.DataFrame(batch, columns=header, index=index, dtype=object)
+
+
+def detect_columns(columns) -> Tuple[object, object]:
+    """Колонки с кодом и ФИО; если заголовков нет — первые две колонки."""
+    code_col = None
+    name_col = None
+
+    for col in columns:
+        col_lower = str(col).lower().strip()
+        if col_lower in POSSIBLE_CODE_NAMES and not code_col:
+            code_col = col
+            logger.info(f"Found code column: {col}")
+        elif col_lower in POSSIBLE_NAME_NAMES and not name_col:
+            name_col = col
+            logger.info(f"Found name column: {col}")
+
+    if not code_col or not name_col:
+        if len(columns) >= 2:
+            code_col = columns[0]
+            name_col = columns[1]
+            logger.info(f"Using first two columns: code={code_col}, name={name_col}")
+        else:
+            raise ValueError(f"Не найдены нужные колонки. Доступные колонки: {list(columns)}")
+
+    return code_col, name_col
+
+
+def _clean_column(series: pd.Series) -> pd.Series:
+    return series.where(series.notna(), "").astype(str).str.strip()
+
+
+def clean_roster(
+    df: pd.DataFrame,
+    code_col,
+    name_col,
+    existing_codes: Set[str],
+) -> Tuple[List[dict], List[Tuple[int, str]]]:
+    """Векторная очистка строк файла.
+
+    Возвращает гостей для вставки и ошибки в виде (номер строки, текст).
+    Найденные коды добавляются в existing_codes, чтобы дубликаты ловились
+    и между пакетами одного файла.
+    """
+    codes = _clean_column(df[code_col])
+    names = _clean_column(df[name_col])
+    # Номер строки в Excel: индекс с нуля + строка заголовка
+    row_numbers = df.index.to_series() + 2
+
+    errors: List[Tuple[int, str]] = []
+
+    empty_name = names == ""
+    for row in row_numbers[empty_name]:
+        errors.append((int(row), f"Строка {row}: пустое имя"))
+
+    empty_code = (codes == "") & ~empty_name
+    if empty_code.any():
+        ts = int(datetime.now().timestamp())
+        codes[empty_code] = [f"NAME-{ts}-{idx}" for idx in df.index[empty_code]]
+
+    valid = ~empty_name
+    in_file_dup = codes[valid].duplicated(keep="first").reindex(codes.index, fill_value=False)
+    duplicated = valid & (in_file_dup | codes.isin(existing_codes))
+    for row, code in zip(row_numbers[duplicated], codes[duplicated]):
+        errors.append((int(row), f"Строка {row}: код '{code}' уже существует"))
+
+    keep = valid & ~duplicated
+    existing_codes.update(codes[keep])
+
+    guests = [
+        {"code": code, "name": name}
+        for code, name in zip(codes[keep], names[keep])
+    ]
+    errors.sort(key=lambda e: e[0])
+    return guests, errors
+
+
+def import_chunk(
+    db: Session,
+    df: pd.DataFrame,
+    code_col,
+    name_col,
+    existing_codes: Set[str],
+) -> Tuple[int, List[Tuple[int, str]]]:
+    """Очищает и вставляет часть файла в одной транзакции.
+
+    Возвращает число добавленных гостей и ошибки строк.
+    """
+    guests, errors = clean_roster(df, code_col, name_col, existing_codes)
+    try:
+        added = insert_guests(db, guests)
+        if added:
+            db.execute(bump_counter_stmt(db, STAT_GUESTS, len(added)))
+        version = roster_sync.bump(db)
+        record_changes(db, CHANGE_GUEST_ADD, [change_item(code, name) for code, name in added])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    roster_sync.apply_local(version, lambda: guest_index.add_many(added))
+    return len(added), errors
@@ -1,26 +1,95 @@
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
+from contextlib import asynccontextmanager, nullcontext
+from sqlalchemy import insert, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from datetime import datetime
+import asyncio
+import codecs
 import csv
-import pandas as pd
+import itertools
 from io import StringIO
-import io
 import logging
-import Levenshtein
-
-from database import Base, engine, SessionLocal
-from models import Guest, Mark, TelegramUser
+import os
+import shutil
+import tempfile
+import zlib
+
+import config
+from database import IS_SQLITE, AsyncSessionLocal, SessionLocal, ensure_schema
+from models import Change, Guest, Mark, TelegramUser
+from search_index import guest_index, normalize
+from scoring import ScoringEngine
+from search_cache import search_cache
+from crud import (
+    CHANGE_CLEAR,
+    CHANGE_GUEST_ADD,
+    CHANGE_MARK,
+    CHANGES_EPOCH,
+    CHANGES_SEQ,
+    STAT_GUESTS,
+    bump_counter_stmt,
+    change_item,
+    change_rows,
+    counter_stmt,
+    mark_change,
+    mark_upsert_stmt,
+    new_marks_stmts,
+    rebuild_stats,
+    record_changes,
+    stats_dict,
+    stats_stmt,
+)
+from group_commit import mark_batcher
+from importer import SUPPORTED_EXTENSIONS
+from import_jobs import ImportJob, failure_text, import_jobs, run_import
+from roster_sync import roster_sync
+from events import event_broker, sse_message
+from code_signing import CodeSigner
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Users Service", version="0.6.1")
-
 # Создаем таблицы
-Base.metadata.create_all(bind=engine)
+ensure_schema()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    db = SessionLocal()
+    try:
+        rebuild_stats(db)
+        db.commit()
+        roster_sync.load(db)
+    finally:
+        db.close()
+    await run_in_threadpool(import_jobs.start)
+    await run_in_threadpool(scoring_engine.start)
+    logger.info(f"Search index built: {len(guest_index)} guests (roster version {roster_sync.version})")
+    if config.GROUP_COMMIT:
+        mark_batcher.start()
+    event_broker.start(stats_snapshot)
+    yield
+    await event_broker.stop()
+    if config.GROUP_COMMIT:
+        mark_batcher.stop()
+    scoring_engine.shutdown()
+    import_jobs.shutdown()
+
+
+app = FastAPI(title="Users Service", version="0.6.1", lifespan=lifespan)
+
+# SQLite пускает одного писателя за раз. Очередь на asyncio.Lock честнее
+# опроса busy_timeout, при котором часть запросов ждёт секундами.
+# PostgreSQL сам разруливает параллельные записи по строкам.
+write_lock = asyncio.Lock() if IS_SQLITE else nullcontext()
+
+scoring_engine = ScoringEngine(config.SEARCH_POOL_THRESHOLD, config.SEARCH_WORKERS)
 
 
 def get_db():
@@ -31,6 +100,11 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 class GuestCreate(BaseModel):
     code: str
     name: str
@@ -41,8 +115,20 @@ class MarkRequest(BaseModel):
     method: str = "qr"
 
 
+class BatchMarkItem(BaseModel):
+    code: str
+    method: str = "qr"
+    scanned_at: Optional[datetime] = None  # время сканирования на устройстве
+
+
+class BatchMarkRequest(BaseModel):
+    marks: List[BatchMarkItem]
+
+
 class SearchResult(BaseModel):
     code: str
+    # Код с подписью (или как есть, если подпись выключена) — для POST /mark
+    signed_code: str
     name: str
     scanned: bool
 
@@ -59,142 +145,178 @@ def health_check():
     return {"status": "ok", "service": "users_service"}
 
 
+def mark_event(mark) -> dict:
+    return {
+        "code": mark.code,
+        "name": mark.name,
+        "timestamp": mark.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+        "method": mark.method,
+        "already_marked": mark.scans > 1,
+    }
+
+
+code_signer = CodeSigner(config.CODE_SIGNING_KEY, config.ACCEPT_PLAIN_CODES)
+
+
 @app.post("/mark")
-def mark_guest(req: MarkRequest, db: Session = Depends(get_db)):
-    code = req.code.strip()
+async def mark_guest(req: MarkRequest, db: AsyncSession = Depends(get_async_db)):
+    code = code_signer.verify(req.code)
+    if code is None:
+        logger.warning(f"Rejected unsigned or forged code: {req.code.strip()}")
+        raise HTTPException(status_code=404, detail="Код не найден: подпись не совпадает")
     logger.info(f"Mark request for code: {code}")
 
-    guest = db.query(Guest).filter(Guest.code == code).first()
-    if not guest:
+    if config.GROUP_COMMIT:
+        mark = await asyncio.wrap_future(mark_batcher.submit(code, req.method, datetime.now()))
+    else:
+        async with write_lock:
+            mark = (await db.execute(mark_upsert_stmt(db, code, req.method, datetime.now()))).first()
+            if mark is not None:
+                if mark.scans == 1:
+                    for stmt in new_marks_stmts(db, [mark.method]):
+                        await db.execute(stmt)
+                    last_seq = (await db.execute(bump_counter_stmt(db, CHANGES_SEQ))).scalar_one()
+                    await db.execute(insert(Change), change_rows(last_seq, CHANGE_MARK, [mark_change(mark)]))
+                await db.commit()
+            else:
+                await db.rollback()
+
+    if mark is None:
         logger.warning(f"Code not found: {code}")
         raise HTTPException(status_code=404, detail="Код не найден")
 
-    name = guest.name
-    now = datetime.now()
-
-    mark = db.query(Mark).filter(Mark.code == code).first()
-    already_marked = mark is not None
-
-    if not mark:
-        mark = Mark(
-            code=code,
-            name=name,
-            method=req.method,
-            timestamp=now,
-        )
-        db.add(mark)
-        logger.info(f"New mark created for code: {code}")
+    already_marked = mark.scans > 1
+    if already_marked:
+        logger.info(f"Repeated scan #{mark.scans} for code: {code}")
     else:
-        mark.name = name
-        mark.method = req.method
-        mark.timestamp = now
-        logger.info(f"Mark updated for code: {code}")
+        logger.info(f"New mark created for code: {code}")
+    search_cache.mark_scanned(code)
 
-    db.commit()
-    db.refresh(mark)
+    data = mark_event(mark)
+    event_broker.publish("mark", data)
 
     return {
         "status": "ok",
         "message": "Отметка сохранена",
         "already_marked": already_marked,
         "data": {
-            "code": mark.code,
-            "name": mark.name,
-            "timestamp": mark.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-            "method": mark.method,
+            "code": data["code"],
+            "name": data["name"],
+            "timestamp": data["timestamp"],
+            "method": data["method"],
         },
     }
 
 
-@app.post("/import_excel")
-async def import_excel(file: UploadFile = File(...), db: Session = Depends(get_db)):
-    logger.info(f"Importing Excel file: {file.filename}")
+def local_naive(ts: datetime) -> datetime:
+    # В базе время хранится как локальное без часового пояса, как datetime.now()
+    if ts.tzinfo is not None:
+        return ts.astimezone().replace(tzinfo=None)
+    return ts
 
-    filename = file.filename.lower()
-    if not (filename.endswith(".xlsx") or filename.endswith(".xls")):
-        raise HTTPException(status_code=400, detail="Ожидается Excel-файл (.xlsx или .xls)")
 
-    content = await file.read()
+@app.post("/mark/batch")
+def mark_batch(req: BatchMarkRequest, db: Session = Depends(get_db)):
+    if len(req.marks) > config.MARK_BATCH_MAX:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Слишком много отметок в одном запросе (максимум {config.MARK_BATCH_MAX})",
+        )
+
+    logger.info(f"Batch mark request: {len(req.marks)} codes")
+    now = datetime.now()
+    results = []
+    marked_codes = []
+    new_marks = []
+    events = []
 
     try:
-        df = pd.read_excel(io.BytesIO(content))
-        logger.info(f"Excel file read successfully. Columns: {list(df.columns)}")
+        for item in req.marks:
+            code = code_signer.verify(item.code)
+            if code is None:
+                results.append({"code": item.code.strip(), "status": "invalid"})
+                continue
+            timestamp = local_naive(item.scanned_at) if item.scanned_at else now
+            mark = db.execute(mark_upsert_stmt(db, code, item.method, timestamp)).first()
+
+            if mark is None:
+                results.append({"code": code, "status": "not_found"})
+                continue
+
+            marked_codes.append(code)
+            if mark.scans == 1:
+                new_marks.append(mark)
+            events.append(mark_event(mark))
+            results.append({
+                "code": code,
+                "status": "already_marked" if mark.scans > 1 else "ok",
+                "name": mark.name,
+                "timestamp": mark.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+                "method": mark.method,
+            })
+        for stmt in new_marks_stmts(db, [m.method for m in new_marks]):
+            db.execute(stmt)
+        record_changes(db, CHANGE_MARK, [mark_change(m) for m in new_marks])
+        db.commit()
     except Exception as e:
-        logger.error(f"Error reading Excel: {e}")
-        raise HTTPException(status_code=400, detail=f"Не удалось прочитать Excel: {str(e)}")
-
-    available_cols = [col.lower().strip() for col in df.columns]
-    logger.info(f"Available columns (lowercase): {available_cols}")
-
-    code_col = None
-    name_col = None
-
-    possible_code_names = ["код"]
-    possible_name_names = ["фио"]
-
-    for col in df.columns:
-        col_lower = col.lower().strip()
-        if col_lower in possible_code_names and not code_col:
-            code_col = col
-            logger.info(f"Found code column: {col}")
-        elif col_lower in possible_name_names and not name_col:
-            name_col = col
-            logger.info(f"Found name column: {col}")
-
-    if not code_col or not name_col:
-        if len(df.columns) >= 2:
-            code_col = df.columns[0]
-            name_col = df.columns[1]
-            logger.info(f"Using first two columns: code={code_col}, name={name_col}")
-        else:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Не найдены нужные колонки. Доступные колонки: {list(df.columns)}",
-            )
+        db.rollback()
+        logger.error(f"Batch mark failed: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка базы данных: {str(e)}")
 
-    added_guests = 0
-    errors = []
-    total_rows = len(df)
+    for code in marked_codes:
+        search_cache.mark_scanned(code)
+    for data in events:
+        event_broker.publish_threadsafe("mark", data)
 
-    for index, row in df.iterrows():
-        try:
-            code_val = row[code_col]
-            name_val = row[name_col]
+    counts = {"ok": 0, "already_marked": 0, "not_found": 0, "invalid": 0}
+    for r in results:
+        counts[r["status"]] += 1
+    logger.info(f"Batch mark done: {counts}")
 
-            code = str(code_val).strip() if not pd.isna(code_val) else ""
-            name = str(name_val).strip() if not pd.isna(name_val) else ""
+    return {"status": "ok", "counts": counts, "results": results}
 
-            logger.debug(f"Processing row {index}: code='{code}', name='{name}'")
 
-            if not name:
-                errors.append(f"Строка {index+2}: пустое имя")
-                continue
+def save_upload(file: UploadFile) -> str:
+    suffix = os.path.splitext(file.filename)[1]
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+        file.file.seek(0)
+        shutil.copyfileobj(file.file, tmp)
+        return tmp.name
 
-            if not code:
-                code = f"NAME-{int(datetime.now().timestamp())}-{index}"
 
-            exists = db.query(Guest).filter(Guest.code == code).first()
-            if exists:
-                errors.append(f"Строка {index+2}: код '{code}' уже существует")
-                continue
+@app.post("/import_excel")
+async def import_excel(
+    file: UploadFile = File(...),
+    background: bool = False,
+    db: Session = Depends(get_db),
+):
+    logger.info(f"Importing roster file: {file.filename}")
 
-            guest = Guest(code=code, name=name)
-            db.add(guest)
-            added_guests += 1
-            logger.info(f"Added guest: {code} - {name}")
+    filename = file.filename.lower()
+    if not filename.endswith(SUPPORTED_EXTENSIONS):
+        raise HTTPException(
+            status_code=400, detail="Ожидается Excel или CSV-файл (.xlsx, .xls или .csv)"
+        )
 
-        except Exception as e:
-            errors.append(f"Строка {index+2}: ошибка обработки - {str(e)}")
-            logger.error(f"Error processing row {index}: {e}")
-            continue
+    if background:
+        path = await run_in_threadpool(save_upload, file)
+        job = import_jobs.submit(file.filename, path)
+        return {"status": "accepted", "job_id": job.id}
 
+    # Загрузка уже лежит во временном файле UploadFile — читаем её потоково
+    job = ImportJob(file.filename)
     try:
-        db.commit()
-        logger.info(f"Successfully committed {added_guests} guests to database")
+        await run_in_threadpool(run_import, db, job, file.file, config.IMPORT_CHUNK_ROWS)
+    except ValueError as e:
+        logger.error(f"Error reading roster after {job.rows_processed} rows: {e}")
+        raise HTTPException(status_code=400, detail=failure_text(job, e))
     except Exception as e:
-        db.rollback()
-        logger.error(f"Database commit error: {e}")
-        raise HTTPException(status_code=500, detail=f"Ошибка базы данных: {str(e)}")
+        logger.error(f"Database commit error after {job.rows_processed} rows: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка базы данных: {failure_text(job, e)}")
+
+    added_guests = job.added_guests
+    total_rows = job.total_rows
+    errors = job.errors
 
     result = {
         "status": "ok",
@@ -211,13 +333,27 @@ async def import_excel(file: UploadFile = File(...), db: Session = Depends(get_d
     return result
 
 
+@app.get("/import_jobs/{job_id}")
+def get_import_job(job_id: str):
+    job = import_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Задача импорта не найдена")
+    return job
+
+
 @app.delete("/clear_all")
 def clear_all(db: Session = Depends(get_db)):
     logger.warning("Clearing all database data")
 
     deleted_marks = db.query(Mark).delete()
     deleted_guests = db.query(Guest).delete()
+    rebuild_stats(db)
+    version = roster_sync.bump(db)
+    # Всё, что было до очистки, репликам больше не нужно
+    db.query(Change).delete()
+    record_changes(db, CHANGE_CLEAR, [change_item()])
     db.commit()
+    roster_sync.apply_local(version, guest_index.clear)
 
     logger.info(f"Database cleared: {deleted_guests} guests, {deleted_marks} marks deleted")
     return {
@@ -247,8 +383,12 @@ def add_guest(data: GuestCreate, db: Session = Depends(get_db)):
 
     guest = Guest(code=code, name=name)
     db.add(guest)
+    db.execute(bump_counter_stmt(db, STAT_GUESTS))
+    version = roster_sync.bump(db)
+    record_changes(db, CHANGE_GUEST_ADD, [change_item(code, name)])
     db.commit()
     db.refresh(guest)
+    roster_sync.apply_local(version, lambda: guest_index.add(guest.code, guest.name))
 
     logger.info(f"Guest added successfully: {code}")
     return {
@@ -259,28 +399,110 @@ def add_guest(data: GuestCreate, db: Session = Depends(get_db)):
 
 
 @app.get("/guests")
-def list_guests(db: Session = Depends(get_db)):
-    guests = db.query(Guest).order_by(Guest.name.asc()).all()
-    return [
-        {"code": g.code, "name": g.name}
-        for g in guests
+def list_guests(
+    limit: Optional[int] = Query(None, ge=1, le=config.GUESTS_PAGE_MAX),
+    after_name: Optional[str] = None,
+    after_code: Optional[str] = None,
+    signed: bool = False,
+    db: Session = Depends(get_db),
+):
+    """Гости по (name, code). Без limit — весь список.
+
+    Следующая страница: after_name/after_code последнего гостя предыдущей.
+    signed=true добавляет signed_code — код для POST /mark.
+    """
+    stmt = select(Guest.code, Guest.name).order_by(Guest.name.asc(), Guest.code.asc())
+    if after_name is not None:
+        # Keyset по индексу ix_guests_name_code: без OFFSET и пересчёта пройденных строк
+        stmt = stmt.where(tuple_(Guest.name, Guest.code) > tuple_(after_name, after_code or ""))
+    if limit is not None:
+        stmt = stmt.limit(limit)
+
+    guests = [
+        {"code": code, "name": name}
+        for code, name in db.execute(stmt)
     ]
+    if signed:
+        for g in guests:
+            g["signed_code"] = code_signer.sign(g["code"])
+    return guests
 
 
 
-@app.get("/stats")
-def get_stats(db: Session = Depends(get_db)):
-    total_guests = db.query(Guest).count()
-    total_scanned = db.query(Mark).count()
+def change_dict(change: Change) -> dict:
+    return {
+        "seq": change.seq,
+        "kind": change.kind,
+        "code": change.code,
+        "name": change.name,
+        "method": change.method,
+        "timestamp": change.timestamp.strftime("%Y-%m-%d %H:%M:%S") if change.timestamp else None,
+    }
+
+
+@app.get("/changes")
+async def get_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(config.CHANGES_PAGE_MAX, ge=1, le=config.CHANGES_PAGE_MAX),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Изменения с номером больше since: guest_add, mark (первая отметка), clear.
+
+    Реплика начинает с since=0 и дальше передаёт last_seq прошлого ответа.
+    После clear всё более раннее уже удалено — реплика очищается и читает
+    дальше. Если epoch отличается от прошлого ответа, базу пересоздали:
+    реплику нужно очистить и начать с since=0.
+    """
+    epoch = (await db.execute(counter_stmt(CHANGES_EPOCH))).scalar_one()
+    head = (await db.execute(counter_stmt(CHANGES_SEQ))).scalar_one_or_none() or 0
+    changes = (await db.execute(
+        select(Change).where(Change.seq > since).order_by(Change.seq).limit(limit)
+    )).scalars().all()
 
     return {
-        "total_guests": total_guests,
-        "total_scanned": total_scanned,
+        "epoch": epoch,
+        "head": head,
+        "last_seq": changes[-1].seq if changes else since,
+        "has_more": len(changes) == limit,
+        "changes": [change_dict(c) for c in changes],
     }
 
 
+@app.get("/stats")
+async def get_stats(db: AsyncSession = Depends(get_async_db)):
+    # Счётчики ведутся в транзакциях записей, таблицы здесь не пересчитываются
+    return stats_dict((await db.execute(stats_stmt())).all())
+
+
+async def stats_snapshot() -> dict:
+    async with AsyncSessionLocal() as db:
+        return stats_dict((await db.execute(stats_stmt())).all())
+
+
+@app.get("/events/stream")
+async def events_stream():
+    """Server-Sent Events: mark — каждая отметка, stats — периодический снимок статистики."""
+    first = sse_message("stats", await stats_snapshot())
+    return StreamingResponse(
+        event_broker.stream(first),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def rank_guests(norm_query: str) -> list:
+    """(code, name, score) лучших совпадений из индекса — чисто CPU, без базы."""
+    codes, names, norm_names = guest_index.snapshot()
+    logger.info(f"Scoring {len(norm_names)} guests")
+
+    matches = scoring_engine.top_k(
+        norm_query, norm_names, config.SEARCH_LIMIT, config.SEARCH_THRESHOLD
+    )
+    return [(codes[i], names[i], score) for i, score in matches]
+
+
 @app.get("/search", response_model=List[SearchResult])
-def search(query: str, db: Session = Depends(get_db)):
+async def search(query: str, db: AsyncSession = Depends(get_async_db)):
     q = query.strip()
     logger.info(f"Search request: '{q}'")
 
@@ -291,47 +513,136 @@ def search(query: str, db: Session = Depends(get_db)):
     if not parts:
         raise HTTPException(status_code=400, detail="Пустой запрос")
 
-    guests = db.query(Guest).all()
-    logger.info(f"Total guests in DB: {len(guests)}")
-
-    norm_query = " ".join(q.lower().split())
-
-    scored = []
-    for g in guests:
-        norm_name = " ".join(str(g.name).lower().split())
-        dist = Levenshtein.distance(norm_query, norm_name)
-        max_len = max(len(norm_query), len(norm_name)) or 1
-        similarity = 1 - dist / max_len
-        scored.append((g, similarity))
+    norm_query = normalize(q)
+    await roster_sync.ensure_fresh(db)
+
+    cached = search_cache.get(norm_query)
+    if cached is not None:
+        logger.info(f"Search cache hit: {len(cached)} results")
+        if roster_sync.enabled and cached:
+            # Отметки могли прийти через другой воркер — флаги берём из базы
+            codes = [r["code"] for r in cached]
+            scanned_codes = set(
+                (await db.execute(select(Mark.code).where(Mark.code.in_(codes)))).scalars()
+            )
+            for r in cached:
+                r["scanned"] = r["code"] in scanned_codes
+        return cached
+    version = search_cache.version
 
-    threshold = 0.5
-    filtered = [(g, s) for g, s in scored if s >= threshold]
+    # Оценка похожести — CPU-работа, уводим её с event loop
+    top = await run_in_threadpool(rank_guests, norm_query)
 
-    if not filtered:
+    if not top:
         pattern = f"%{parts[0]}%"
-        guests = db.query(Guest).filter(Guest.name.ilike(pattern)).all()
-        logger.info(f"Fallback ilike found {len(guests)} guests")
-        filtered = [(g, 1.0) for g in guests]
-
-    filtered.sort(key=lambda x: x[1], reverse=True)
-
-    all_marks = {mark.code: mark for mark in db.query(Mark).all()}
+        guests = await db.execute(
+            select(Guest.code, Guest.name).where(Guest.name.ilike(pattern)).limit(config.SEARCH_LIMIT)
+        )
+        top = [(code, name, 1.0) for code, name in guests]
+        logger.info(f"Fallback ilike found {len(top)} guests")
+
+    codes = [code for code, _, _ in top]
+    scanned_codes = set()
+    if codes:
+        scanned_codes = set(
+            (await db.execute(select(Mark.code).where(Mark.code.in_(codes)))).scalars()
+        )
 
     results: List[SearchResult] = []
-    for guest, sim in filtered[:50]:
-        scanned = guest.code in all_marks
+    for code, name, sim in top:
+        scanned = code in scanned_codes
         results.append(
             SearchResult(
-                code=guest.code,
-                name=guest.name,
+                code=code,
+                signed_code=code_signer.sign(code),
+                name=name,
                 scanned=scanned,
             )
         )
 
+    search_cache.put(norm_query, version, [r.model_dump() for r in results])
+
     logger.info(f"Returning {len(results)} search results")
     return results
 
 
+@app.get("/metrics")
+def get_metrics():
+    metrics = {
+        "search_cache": search_cache.stats(),
+        "roster_sync": roster_sync.stats(),
+        "events": event_broker.stats(),
+        "code_signing": code_signer.stats(),
+    }
+    if config.GROUP_COMMIT:
+        metrics["group_commit"] = mark_batcher.stats()
+    return metrics
+
+
+EXPORT_HEADER = ["Код", "ФИО", "Статус", "Время отметки", "Метод", "Источник"]
+
+
+def export_row(code: str, name: str, timestamp: Optional[datetime], method: Optional[str]) -> list:
+    if timestamp is not None:
+        return [code, name, "Отмечен", timestamp.strftime("%Y-%m-%d %H:%M:%S"), method, ""]
+    return [code, name, "Не отмечен", "", "", "Гость добавлен"]
+
+
+def iter_export_csv(chunk_rows: int = 1000):
+    db = SessionLocal()
+    try:
+        buffer = StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_HEADER)
+
+        stmt = (
+            select(Guest.code, Guest.name, Mark.timestamp, Mark.method)
+            .outerjoin(Mark, Mark.code == Guest.code)
+            .order_by(Guest.id)
+            .execution_options(yield_per=chunk_rows)
+        )
+        for i, row in enumerate(db.execute(stmt), start=1):
+            writer.writerow(export_row(*row))
+            if i % chunk_rows == 0:
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+
+        yield buffer.getvalue().encode("utf-8")
+    finally:
+        db.close()
+
+
+def gzip_stream(chunks):
+    compressor = zlib.compressobj(wbits=31)  # 31 — формат gzip
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+@app.get("/export/csv")
+def export_csv(gzip: bool = False):
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    filename = f"stat_{timestamp}.csv"
+
+    # BOM, чтобы Excel открыл кириллицу в UTF-8
+    body = itertools.chain([codecs.BOM_UTF8], iter_export_csv())
+    media_type = "text/csv; charset=utf-8"
+    if gzip:
+        body = gzip_stream(body)
+        filename += ".gz"
+        media_type = "application/gzip"
+
+    logger.info(f"Streaming export: {filename}")
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
 @app.get("/export")
 def export_data(db: Session = Depends(get_db)):
     guests = db.query(Guest).all()
@@ -339,29 +650,21 @@ def export_data(db: Session = Depends(get_db)):
 
     csv_output = StringIO()
     writer = csv.writer(csv_output)
-    writer.writerow(["Код", "ФИО", "Статус", "Время отметки", "Метод", "Источник"])
+    writer.writerow(EXPORT_HEADER)
 
     marks_by_code = {m.code: m for m in marks}
 
     for guest in guests:
         mark = marks_by_code.get(guest.code)
         if mark:
-            status = "Отмечен"
-            timestamp = mark.timestamp.strftime("%Y-%m-%d %H:%M:%S")
-            method = mark.method
-            source = ""
+            writer.writerow(export_row(guest.code, guest.name, mark.timestamp, mark.method))
         else:
-            status = "Не отмечен"
-            timestamp = ""
-            method = ""
-            source = "Гость добавлен"
-
-        writer.writerow([guest.code, guest.name, status, timestamp, method, source])
+            writer.writerow(export_row(guest.code, guest.name, None, None))
 
     csv_content = csv_output.getvalue()
     csv_output.close()
 
-    stats = get_stats(db)
+    stats = stats_dict(db.execute(stats_stmt()).all())
 
     txt_lines = [
         "СТАТИСТИКА СИСТЕМЫ ОТМЕТКИ",
@@ -422,8 +725,8 @@ def add_telegram_user(data: TelegramUserCreate, db: Session = Depends(get_db)):
 
 
 @app.get("/tg_users")
-def list_telegram_users(db: Session = Depends(get_db)):
-    users = db.query(TelegramUser).all()
+async def list_telegram_users(db: AsyncSession = Depends(get_async_db)):
+    users = (await db.execute(select(TelegramUser))).scalars().all()
     return [
         {
             "telegram_id": u.telegram_id,
@@ -435,7 +738,29 @@ def list_telegram_users(db: Session = Depends(get_db)):
     ]
 
 
+# Проверка доступа бота: одна строка по уникальному индексу, наружу — только флаг
+@app.get("/tg_users/by_username/{username}")
+async def telegram_user_allowed_by_username(username: str, db: AsyncSession = Depends(get_async_db)):
+    allowed = (
+        await db.execute(
+            select(TelegramUser.allowed).where(TelegramUser.username == username.lstrip("@"))
+        )
+    ).scalar_one_or_none()
+    return {"allowed": bool(allowed)}
+
+
+@app.get("/tg_users/{telegram_id}")
+async def telegram_user_allowed(telegram_id: int, db: AsyncSession = Depends(get_async_db)):
+    allowed = (
+        await db.execute(
+            select(TelegramUser.allowed).where(TelegramUser.telegram_id == telegram_id)
+        )
+    ).scalar_one_or_none()
+    return {"allowed": bool(allowed)}
+
+
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Несколько воркеров uvicorn запускает только по строке импорта приложения
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=config.WORKERS)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, BigInteger, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, BigInteger, Boolean, Text, Index
 from sqlalchemy.sql import func
 from database import Base
 
@@ -10,15 +10,19 @@ class Guest(Base):
     code = Column(String, unique=True, index=True, nullable=False)
     name = Column(String, nullable=False)
 
+    # Порядок списка гостей и ключ постраничной выдачи /guests
+    __table_args__ = (Index("ix_guests_name_code", "name", "code"),)
+
 
 class Mark(Base):
     __tablename__ = "marks"
 
     id = Column(Integer, primary_key=True, index=True)
-    code = Column(String, index=True, nullable=False)
+    code = Column(String, unique=True, index=True, nullable=False)
     name = Column(String, nullable=False)
     method = Column(String, nullable=False)  # qr / manual / search
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    scans = Column(Integer, nullable=False, default=1, server_default="1")  # сколько раз сканировали
 
 
 class TelegramUser(Base):
@@ -29,3 +33,46 @@ class TelegramUser(Base):
     username = Column(String, unique=True, nullable=True)
     name = Column(String, nullable=False)
     allowed = Column(Boolean, default=True)
+
+
+class Counter(Base):
+    __tablename__ = "counters"
+
+    name = Column(String, primary_key=True)  # roster_version, ...
+    value = Column(BigInteger, nullable=False, default=0)
+
+
+class Change(Base):
+    """Журнал изменений для реплик: GET /changes?since=<seq>."""
+
+    __tablename__ = "changes"
+
+    # Номер берётся из счётчика changes_seq под блокировкой его строки,
+    # поэтому транзакции коммитятся строго по возрастанию seq
+    seq = Column(BigInteger, primary_key=True, autoincrement=False)
+    kind = Column(String, nullable=False)  # guest_add / mark / clear
+    code = Column(String, nullable=True)
+    name = Column(String, nullable=True)
+    method = Column(String, nullable=True)
+    timestamp = Column(DateTime(timezone=True), nullable=True)
+
+
+class ImportJobRecord(Base):
+    __tablename__ = "import_jobs"
+
+    id = Column(String, primary_key=True)
+    filename = Column(String, nullable=False)
+    status = Column(String, nullable=False)  # queued / running / done / failed
+    total_rows = Column(Integer, nullable=True)
+    rows_processed = Column(Integer, nullable=False, default=0)
+    added_guests = Column(Integer, nullable=False, default=0)
+    errors_count = Column(Integer, nullable=False, default=0)
+    errors = Column(Text, nullable=False, default="[]")  # JSON, первые 10 ошибок
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+    # Загруженный файл, процесс-владелец и его последняя отметка «жив»:
+    # по ним другой воркер находит задачи упавшего процесса
+    upload_path = Column(String, nullable=True)
+    owner = Column(String, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
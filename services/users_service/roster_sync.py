@@ -0,0 +1,90 @@
+import logging
+import threading
+from typing import Callable
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import config
+from crud import bump_counter_stmt, counter_stmt
+from models import Guest
+from search_cache import search_cache
+from search_index import guest_index
+
+logger = logging.getLogger(__name__)
+
+ROSTER_VERSION = "roster_version"
+
+
+class RosterSync:
+    """Согласует индекс поиска и кэш с версией списка гостей в базе.
+
+    Каждое изменение гостей увеличивает счётчик roster_version в той же
+    транзакции. Процесс помнит, до какой версии его индекс актуален; если в
+    базе версия другая — список менял другой воркер, и индекс пересобирается.
+    """
+
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self.version = 0
+        self.rebuilds = 0
+        self._lock = threading.Lock()
+
+    def bump(self, db: Session) -> int:
+        """Увеличивает версию в текущей транзакции, коммит — на вызывающем."""
+        return db.execute(bump_counter_stmt(db, ROSTER_VERSION)).scalar_one()
+
+    def apply_local(self, version: int, update: Callable[[], None]):
+        """Вносит закоммиченное локальное изменение в индекс и сбрасывает кэш.
+
+        update выполняется под тем же замком, что и пересборка, чтобы
+        пересборка по старому снимку не затёрла его молча.
+        """
+        with self._lock:
+            update()
+            search_cache.bump_version()
+            # Между нашими версиями вклинился чужой коммит — индекс отстал,
+            # его пересоберёт ensure_fresh
+            if version == self.version + 1:
+                self.version = version
+
+    def load(self, db: Session):
+        """Полная сборка индекса при старте."""
+        version = db.execute(counter_stmt(ROSTER_VERSION)).scalar_one()
+        guest_index.rebuild(db.execute(select(Guest.code, Guest.name)).all())
+        with self._lock:
+            self.version = version
+
+    async def ensure_fresh(self, db: AsyncSession):
+        if not self.enabled:
+            return
+
+        version = (await db.execute(counter_stmt(ROSTER_VERSION))).scalar_one()
+        if version == self.version:
+            return
+
+        # Версию читаем до гостей: индекс может оказаться новее версии,
+        # но не старше — в худшем случае лишний раз пересоберём
+        rows = (await db.execute(select(Guest.code, Guest.name))).all()
+        await run_in_threadpool(self._rebuild, rows, version)
+        logger.info(f"Search index rebuilt for roster version {version}: {len(rows)} guests")
+
+    def _rebuild(self, rows, version: int):
+        with self._lock:
+            guest_index.rebuild(rows)
+            search_cache.bump_version()
+            self.version = version
+            self.rebuilds += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "version": self.version,
+                "rebuilds": self.rebuilds,
+            }
+
+
+roster_sync = RosterSync(config.COHERENT_CACHES)
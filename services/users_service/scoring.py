@@ -0,0 +1,88 @@
+import heapq
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Sequence, Tuple
+
+from rapidfuzz import process
+from rapidfuzz.distance import Levenshtein
+
+logger = logging.getLogger(__name__)
+
+
+def _score_chunk(
+    query: str,
+    names: Sequence[str],
+    offset: int,
+    limit: int,
+    threshold: float,
+) -> List[Tuple[int, float]]:
+    # normalized_similarity = 1 - distance / max(len(query), len(name)),
+    # та же формула, что и в старом цикле /search
+    matches = process.extract(
+        query,
+        names,
+        scorer=Levenshtein.normalized_similarity,
+        processor=None,
+        score_cutoff=threshold,
+        limit=limit,
+    )
+    return [(offset + idx, score) for _, score, idx in matches]
+
+
+class ScoringEngine:
+    """Пакетная оценка похожести запроса на список нормализованных имён.
+
+    Весь список оценивается одним вызовом rapidfuzz (C++), а начиная с
+    pool_threshold имён пакет делится на части между процессами
+    (0 — без пула). Пул поднимает start(); процессы запускаются через
+    forkserver: fork из процесса с потоками event loop и пула соединений
+    мог бы унаследовать чужую захваченную блокировку.
+    """
+
+    def __init__(self, pool_threshold: int, workers: Optional[int] = None):
+        self.pool_threshold = pool_threshold
+        self.workers = workers or os.cpu_count() or 1
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def pooled(self) -> bool:
+        return self.pool_threshold > 0 and self.workers >= 2
+
+    def start(self):
+        """Запускает процессы пула заранее, а не на первом большом запросе."""
+        if not self.pooled or self._pool is not None:
+            return
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("forkserver"),
+        )
+        # Процессы не-fork пула стартуют все сразу на первой задаче
+        self._pool.submit(int).result()
+        logger.info(f"Scoring process pool started: {self.workers} workers")
+
+    def top_k(
+        self,
+        query: str,
+        names: Sequence[str],
+        k: int,
+        threshold: float,
+    ) -> List[Tuple[int, float]]:
+        """Индексы и оценки k самых похожих имён с оценкой не ниже threshold."""
+        if self._pool is None or len(names) < self.pool_threshold:
+            return _score_chunk(query, names, 0, k, threshold)
+
+        # Части списка пиклятся в процессы на каждый запрос
+        chunk_size = -(-len(names) // self.workers)
+        futures = [
+            self._pool.submit(_score_chunk, query, names[start:start + chunk_size], start, k, threshold)
+            for start in range(0, len(names), chunk_size)
+        ]
+        merged = [match for f in futures for match in f.result()]
+        return heapq.nlargest(k, merged, key=lambda x: x[1])
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
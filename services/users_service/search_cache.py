@@ -0,0 +1,90 @@
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Dict, List, Optional, Set
+
+import config
+
+
+class SearchCache:
+    """LRU-кэш результатов /search по нормализованному запросу.
+
+    Любое изменение списка гостей увеличивает version и сбрасывает кэш,
+    а отметка гостя только выставляет scanned в уже закэшированных результатах.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, List[dict]]" = OrderedDict()
+        self._keys_by_code: Dict[str, Set[str]] = defaultdict(set)
+        # Коды, отмеченные после последней смены версии
+        self._marked: Set[str] = set()
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[List[dict]]:
+        with self._lock:
+            results = self._entries.get(key)
+            if results is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return [dict(r) for r in results]
+
+    def put(self, key: str, version: int, results: List[dict]):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            # Пока считали результат, список гостей успел измениться
+            if version != self.version:
+                return
+            if key in self._entries:
+                self._drop_locked(key)
+
+            results = [dict(r) for r in results]
+            for r in results:
+                if r["code"] in self._marked:
+                    r["scanned"] = True
+                self._keys_by_code[r["code"]].add(key)
+            self._entries[key] = results
+            while len(self._entries) > self.maxsize:
+                oldest = next(iter(self._entries))
+                self._drop_locked(oldest)
+
+    def _drop_locked(self, key: str):
+        for r in self._entries.pop(key):
+            keys = self._keys_by_code.get(r["code"])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_code[r["code"]]
+
+    def bump_version(self):
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+            self._keys_by_code.clear()
+            self._marked.clear()
+
+    def mark_scanned(self, code: str):
+        with self._lock:
+            self._marked.add(code)
+            for key in self._keys_by_code.get(code, ()):
+                for r in self._entries[key]:
+                    if r["code"] == code:
+                        r["scanned"] = True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "version": self.version,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+search_cache = SearchCache(config.SEARCH_CACHE_SIZE)
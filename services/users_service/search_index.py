@@ -0,0 +1,73 @@
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+
+def normalize(text: str) -> str:
+    return " ".join(str(text).lower().split())
+
+
+class GuestIndex:
+    """Список гостей с нормализованными именами для /search.
+
+    Отбор кандидатов по триграммам убран: по benchmarks/bench_search.py
+    полный проход rapidfuzz быстрее при любом размере списка.
+
+    Гости в базе только добавляются (/guests, /import_excel) или удаляются все
+    сразу (/clear_all), поэтому индекс поддерживает только add и clear.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.codes: List[str] = []
+        self.names: List[str] = []
+        self.norm_names: List[str] = []
+        self._positions: Dict[str, int] = {}
+
+    def __len__(self):
+        return len(self.codes)
+
+    def _add_locked(self, code: str, name: str):
+        if code in self._positions:
+            return
+        pos = len(self.codes)
+        norm = normalize(name)
+        self.codes.append(code)
+        self.names.append(name)
+        self.norm_names.append(norm)
+        self._positions[code] = pos
+
+    def add(self, code: str, name: str):
+        with self._lock:
+            self._add_locked(code, name)
+
+    def add_many(self, guests: Iterable[Tuple[str, str]]):
+        with self._lock:
+            for code, name in guests:
+                self._add_locked(code, name)
+
+    def rebuild(self, guests: Iterable[Tuple[str, str]]):
+        with self._lock:
+            self._reset()
+            for code, name in guests:
+                self._add_locked(code, name)
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    def snapshot(self) -> Tuple[List[str], List[str], List[str]]:
+        """Параллельные списки (codes, names, norm_names) всего списка гостей.
+
+        Без копирования: списки только дописываются, а clear и rebuild
+        заменяют их новыми. Пока вызывающий работает со снимком, в него могут
+        дописаться гости, но norm_names дописывается последним — любой индекс
+        из него есть и в codes, и в names.
+        """
+        with self._lock:
+            return self.codes, self.names, self.norm_names
+
+
+guest_index = GuestIndex()